@@ -3,6 +3,7 @@ import os
 import shutil
 from pathlib import Path
 import customtkinter
+import googleapiclient
 
 def build():
     # Clean previous builds
@@ -11,6 +12,9 @@ def build():
             shutil.rmtree(d)
 
     ctk_path = os.path.dirname(customtkinter.__file__)
+    # YouTube APIのディスカバリードキュメント（起動時のネットワーク取得を省くため同梱）
+    discovery_doc = os.path.join(os.path.dirname(googleapiclient.__file__),
+                                 'discovery_cache', 'documents', 'youtube.v3.json')
     
     PyInstaller.__main__.run([
         'run_app.py',
@@ -20,12 +24,16 @@ def build():
         f'--icon=src/favicon.ico',
         f'--add-data={ctk_path};customtkinter/',
         '--add-data=src/cvcutter;cvcutter/',
+        f'--add-data={discovery_doc};googleapiclient/discovery_cache/documents/',
         '--copy-metadata=imageio',
         '--collect-submodules=cv2',
         '--collect-submodules=moviepy',
         '--collect-submodules=librosa',
         '--collect-submodules=scipy',
         '--collect-submodules=imageio_ffmpeg',
+        # Windowsにはタイムゾーンデータベースがないため、zoneinfo用にtzdataを同梱する
+        '--collect-data=tzdata',
+        '--hidden-import=tzdata',
         '--exclude-module=matplotlib',
         '--exclude-module=IPython',
         '--exclude-module=jedi',
@@ -3,6 +3,7 @@ from tkinter import filedialog, messagebox
 import customtkinter as ctk
 from PIL import Image
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
 import queue
@@ -12,14 +13,10 @@ import json
 from datetime import datetime
 
 # Logic imports
+# 重い依存（OpenCV, librosa, Google API クライアント等）を持つモジュールは
+# 起動時間短縮のため、実際に使用する箇所でインポートする
 from .config_manager import ConfigManager
-from . import video_processor
-from .create_google_form import create_concert_form, authenticate_forms_api, save_form_config, load_form_history
-from .video_mapper import get_video_files_sorted, map_program_to_videos, map_with_form_responses, generate_upload_metadata
-from .google_form_connector import FormResponseParser
-from .pdf_parser import parse_concert_pdf
-from .gemini_utils import configure_gemini
-from . import youtube_uploader
+from .json_utils import save_json
 
 # --- Console Redirector ---
 class ConsoleRedirector:
@@ -208,7 +205,14 @@ class ConcertVideoApp(ctk.CTk):
         self.form_id_var = ctk.StringVar(value=self.config['paths']['form_id'])
         ctk.CTkEntry(in_frame, textvariable=self.form_id_var, width=400).grid(row=1, column=1, padx=10, pady=5)
 
-        ctk.CTkButton(in_frame, text="マッピングを生成", command=self._run_mapping).grid(row=2, column=1, pady=10)
+        opt_row = ctk.CTkFrame(in_frame, fg_color="transparent")
+        opt_row.grid(row=2, column=1, padx=10, sticky="w")
+        self.force_reparse_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(opt_row, text="PDFを再解析する（保存済みの解析結果を使わない）", variable=self.force_reparse_var).pack(side=tk.LEFT)
+        self.no_gemini_cache_var = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(opt_row, text="Geminiの応答キャッシュを使わない", variable=self.no_gemini_cache_var).pack(side=tk.LEFT, padx=(10, 0))
+
+        ctk.CTkButton(in_frame, text="マッピングを生成", command=self._run_mapping).grid(row=3, column=1, pady=10)
 
         # Preview Scrollable
         self.preview_area = ctk.CTkScrollableFrame(tab, label_text="マッピング プレビュー")
@@ -537,6 +541,7 @@ Google API の無料枠には、1日あたりのアップロード数に制限
             try:
                 if target == "forms":
                     print("Google フォーム認証を開始します。ブラウザを確認してください...")
+                    from .create_google_form import authenticate_forms_api
                     authenticate_forms_api(client_secrets_path=Path(secrets))
                     print("Google フォームの認証が完了しました！")
                     self.after(0, lambda: messagebox.showinfo("成功", "Google フォームの認証に成功しました。"))
@@ -561,9 +566,9 @@ Google API の無料枠には、1日あたりのアップロード数に制限
         def task():
             try:
                 print("Gemini APIキーを検証中...")
+                from .gemini_utils import configure_gemini, call_gemini_api
                 configure_gemini(key)
-                from .gemini_utils import call_gemini_api
-                call_gemini_api("Hello, this is a test message to verify the API key.")
+                call_gemini_api("Hello, this is a test message to verify the API key.", use_cache=False)
                 print("Gemini APIキーの検証に成功しました！")
                 self.after(0, lambda: messagebox.showinfo("成功", "Gemini APIキーは有効です。"))
             except Exception as e:
@@ -608,6 +613,7 @@ Google API の無料枠には、1日あたりのアップロード数に制限
 
         def task():
             try:
+                from .create_google_form import create_concert_form, authenticate_forms_api, save_form_config
                 service = authenticate_forms_api(client_secrets_path=Path(secrets))
                 info = create_concert_form(service, form_title=title)
                 save_form_config(info)
@@ -628,6 +634,7 @@ Google API の無料枠には、1日あたりのアップロード数に制限
 
         def task():
             print("--- バッチ処理を開始します ---")
+            from . import video_processor
             total_items = len(self.queue_data)
             start_time = time.time()
             
@@ -667,6 +674,8 @@ Google API の無料枠には、1日あたりのアップロード数に制限
     def _run_mapping(self):
         pdf = self.pdf_var.get()
         form_id = self.form_id_var.get()
+        force_reparse = self.force_reparse_var.get()
+        use_cache = not self.no_gemini_cache_var.get()
         if not pdf:
             messagebox.showerror("Error", "PDF path is required.")
             return
@@ -674,20 +683,43 @@ Google API の無料枠には、1日あたりのアップロード数に制限
         def task():
             print("--- マッピング解析を実行中 ---")
             try:
+                from .pdf_parser import parse_concert_pdf
+                from .google_form_connector import FormResponseParser
+                from .video_mapper import get_video_files_sorted, map_program_to_videos, map_with_form_responses
                 secrets = self.secrets_var.get()
-                # 1. PDF
-                self.program_data = parse_concert_pdf(Path(pdf))
-                # 2. Form
+                output_dir = Path(self.config['paths']['output_dir'])
+                pdf_path = Path(pdf)
                 parser = FormResponseParser()
-                form_resps = parser.load_from_forms_api(form_id if form_id else None)
-                # 3. Videos in output
-                video_infos = get_video_files_sorted(Path(self.config['paths']['output_dir']))
+                # 1〜3は互いに独立したI/O待ち（Gemini, Forms API, ディスク）なので並行して実行
+                with ThreadPoolExecutor(max_workers=3) as executor:
+                    # 1. PDF（PDFより新しい解析結果があれば再利用。再解析時はGeminiのキャッシュも使わない）
+                    program_future = executor.submit(
+                        parse_concert_pdf, pdf_path, output_dir / f"{pdf_path.stem}_program.json",
+                        force_reparse=force_reparse,
+                        use_cache=use_cache and not force_reparse
+                    )
+                    # 2. Form（短時間内の再実行ではキャッシュを利用）
+                    form_future = executor.submit(
+                        parser.load_from_forms_api,
+                        form_id if form_id else None,
+                        cache_path=output_dir / "form_responses.json"
+                    )
+                    # 3. Videos in output
+                    video_future = executor.submit(get_video_files_sorted, output_dir)
+
+                    self.program_data = program_future.result()
+                    form_resps = form_future.result()
+                    video_infos = video_future.result()
                 # 4. Map
                 p_v_map = map_program_to_videos(self.program_data, video_infos)
-                self.mapping_results = map_with_form_responses(p_v_map, form_resps, use_gemini=True)
+                self.mapping_results = map_with_form_responses(p_v_map, form_resps, use_gemini=True,
+                                                               use_cache=use_cache)
                 
                 self.after(0, self._update_preview_ui)
                 self.after(0, self._generate_and_save_metadata)
+                if force_reparse:
+                    # 再解析は1回限り（次回からは新しい解析結果を再利用する）
+                    self.after(0, lambda: self.force_reparse_var.set(False))
                 print("--- マッピング解析完了 ---")
             except Exception as e:
                 print(f"マッピングエラー: {e}")
@@ -721,13 +753,13 @@ Google API の無料枠には、1日あたりのアップロード数に制限
 
         print("--- アップロード用メタデータを生成・保存します ---")
         try:
+            from .video_mapper import generate_upload_metadata
             # _run_mappingで保存したprogram_dataを使用
             concert_info = self.program_data.get("concert_info") if self.program_data else None
             metadata = generate_upload_metadata(self.mapping_results, concert_info)
 
             metadata_path = Path(self.config['paths']['output_dir']) / "upload_metadata.json"
-            with open(metadata_path, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+            save_json(metadata, metadata_path)
             print(f"✓ メタデータを保存しました: {metadata_path}")
             
             # アップロードタブの表示も更新
@@ -757,20 +789,22 @@ Google API の無料枠には、1日あたりのアップロード数に制限
              return
         secrets_path = Path(secrets_path_str)
         chunk_size = self.config['workflow'].get('youtube_chunk_size', 1048576)
+        max_workers = self.config['workflow'].get('youtube_upload_workers', 3)
 
         def task():
             try:
                 print("--- YouTubeアップロード処理を開始します ---")
+                from . import youtube_uploader
                 print(f"チャンクサイズ: {chunk_size / (1024*1024):.1f} MB")
                 updated_metadata, summary = youtube_uploader.batch_upload(
                     metadata_file=metadata_path,
                     client_secrets_path=secrets_path,
-                    chunk_size=chunk_size
+                    chunk_size=chunk_size,
+                    max_workers=max_workers
                 )
 
                 # アップローダーが返したURL情報などを含む最新のメタデータを保存
-                with open(metadata_path, 'w', encoding='utf-8') as f:
-                    json.dump(updated_metadata, f, ensure_ascii=False, indent=2)
+                save_json(updated_metadata, metadata_path)
 
                 print(f"--- アップロード処理完了: {summary.get('success', 0)}件成功 ---")
                 self.after(0, self._display_upload_results)
@@ -860,6 +894,7 @@ Google API の無料枠には、1日あたりのアップロード数に制限
         edit_window.grab_set() # Modal
 
         # Get all available video files from output dir
+        from .video_mapper import get_video_files_sorted
         output_dir = Path(self.config['paths']['output_dir'])
         available_videos = get_video_files_sorted(output_dir)
         video_filenames = [os.path.basename(v['file_path']) for v in available_videos]
@@ -919,6 +954,7 @@ Google API の無料枠には、1日あたりのアップロード数に制限
             widget.destroy()
 
         try:
+            from .create_google_form import load_form_history
             history = load_form_history() # 最新3件が返される想定
 
             if not history:
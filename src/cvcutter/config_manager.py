@@ -17,6 +17,7 @@ def get_app_data_path(filename: str) -> Path:
     return base_path / filename
 
 CONFIG_FILE = get_app_data_path("app_config.json")
+CACHE_DIR = get_app_data_path("cache")
 
 DEFAULT_CONFIG = {
     "paths": {
@@ -42,7 +43,8 @@ DEFAULT_CONFIG = {
         "skip_upload": False,
         "gemini_api_key": "",
         "gemini_model": "gemini-2.5-flash",
-        "youtube_chunk_size": 5242880  # 5MB
+        "youtube_chunk_size": 5242880,  # 5MB
+        "youtube_upload_workers": 3
     }
 }
 
@@ -84,9 +84,19 @@ def detect_performances_by_motion(video_path, config):
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
+
+    # 解析用に縮小する幅（None = 元の解像度）。面積のしきい値とゾーン境界は縮小後の座標で扱う
+    detection_width = config.get('detection_width')
+    scale = detection_width / width if detection_width and detection_width < width else 1.0
+    if scale < 1.0:
+        width, height = int(round(width * scale)), int(round(height * scale))
+    min_contour_area = config['min_contour_area'] * scale * scale
     
     max_frames = int(config['max_seconds_to_process'] * fps) if config['max_seconds_to_process'] is not None else float('inf')
 
+    # 何フレームごとに解析するか（1 = 全フレーム）。間のフレームは grab() で読み飛ばし、画像への変換を省く
+    stride = max(1, int(config.get('frame_stride', 1)))
+
     # --- ゾーンと状態の管理 ---
     LEFT_ZONE_END = width * config['left_zone_end_percent']
     CENTER_ZONE_END = width * config['center_zone_end_percent']
@@ -95,27 +105,39 @@ def detect_performances_by_motion(video_path, config):
     performance_segments = []
 
     # --- CVオブジェクト ---
-    back_sub = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=config['mog2_threshold'], detectShadows=False)
-    ct = CentroidTracker(max_disappeared=int(fps * 3)) # 静止時間を考慮し、少し長めに設定
+    # 履歴長と消失判定は「解析したフレーム数」で数えるため、間引き分だけ縮めて時間換算を揃える
+    back_sub = cv2.createBackgroundSubtractorMOG2(history=max(1, 500 // stride), varThreshold=config['mog2_threshold'], detectShadows=False)
+    ct = CentroidTracker(max_disappeared=max(1, int(fps * 3 / stride))) # 静止時間を考慮し、少し長めに設定
 
     # --- 以前のフレームのオブジェクト位置を追跡 ---
     # IDごとのゾーン履歴を保持
     last_known_zones = defaultdict(lambda: 'unknown')
     
+    thresh = eroded = small_frame = None
+    analyzed_frames = 0
     frame_number = 0
     while cap.isOpened() and frame_number < max_frames:
         ret, frame = cap.read()
         if not ret:
             break
 
+        if scale < 1.0:
+            small_frame = cv2.resize(frame, (width, height), dst=small_frame, interpolation=cv2.INTER_AREA)
+            frame = small_frame
+
         fg_mask = back_sub.apply(frame)
-        thresh = cv2.threshold(fg_mask, 128, 255, cv2.THRESH_BINARY)[1]
-        thresh = cv2.erode(thresh, None, iterations=2)
-        thresh = cv2.dilate(thresh, None, iterations=4)
+        # マスク用のバッファは最初のフレームで確保し、以降は使い回す（毎フレームの確保を避ける）
+        if thresh is None:
+            thresh = np.empty_like(fg_mask)
+            eroded = np.empty_like(fg_mask)
+        cv2.threshold(fg_mask, 128, 255, cv2.THRESH_BINARY, dst=thresh)
+        cv2.erode(thresh, None, dst=eroded, iterations=2)
+        cv2.dilate(eroded, None, dst=thresh, iterations=4)
         
-        contours, _ = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # OpenCV 3.2以降のfindContoursは入力画像を変更しないため、コピーは不要
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
-        rects = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) > config['min_contour_area']]
+        rects = [cv2.boundingRect(c) for c in contours if cv2.contourArea(c) > min_contour_area]
         tracked_centroids = ct.update(rects, width)
 
         current_zones = {}
@@ -167,8 +189,15 @@ def detect_performances_by_motion(video_path, config):
                 break
 
         frame_number += 1
-        if not config['show_video'] and frame_number > 0 and frame_number % 100 == 0:
+        analyzed_frames += 1
+        if not config['show_video'] and analyzed_frames % 100 == 0:
             print(f"  ... フレーム {frame_number} を処理中 ({frame_number / fps:.2f}秒地点)")
+
+        # 次に解析するフレームまで読み飛ばす
+        for _ in range(stride - 1):
+            if frame_number >= max_frames or not cap.grab():
+                break
+            frame_number += 1
     
     cap.release()
     if config['show_video']:
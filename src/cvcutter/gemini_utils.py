@@ -1,61 +1,206 @@
+import functools
+import hashlib
 import logging
+import os
+import re
+import time
 import google.generativeai as genai
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 import json
+from .config_manager import CACHE_DIR, CONFIG_FILE, ConfigManager
+from . import json_utils
 
 logger = logging.getLogger(__name__)
 
 # デフォルトモデル
 DEFAULT_MODEL = "gemini-2.5-flash"
 
+# アップロード済みファイルを再利用する期間（秒）。Gemini側の保持期間（48時間）より短くする
+UPLOADED_FILE_TTL = 24 * 3600
+
+# Gemini応答のキャッシュ（同一のモデル・プロンプト・ファイルに対する再呼び出しを省略）
+GEMINI_CACHE_DIR = CACHE_DIR / "gemini"
+GEMINI_CACHE_MAX_AGE = 30 * 24 * 3600
+
+# ```json ... ``` または ``` ... ``` で囲まれた部分（最初に現れたもの）
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```|$)", re.S)
+
+# 最後に構成したAPIキー（同じキーでの再構成を省略するため）
+_configured_api_key: Optional[str] = None
+
+# (絶対パス, 更新時刻, サイズ) -> (アップロード時刻, アップロード済みファイル)
+_uploaded_files: Dict[tuple, tuple] = {}
+
 def configure_gemini(api_key: str):
     """
-    Gemini APIを構成する
+    Gemini APIを構成する（同じキーで構成済みの場合は何もしない）
     """
+    global _configured_api_key
     if not api_key:
         raise ValueError("Gemini APIキーが設定されていません。設定画面から入力してください。")
+    if api_key == _configured_api_key:
+        return
     genai.configure(api_key=api_key)
+    _configured_api_key = api_key
+    _get_model.cache_clear()
+    _uploaded_files.clear()
+
+@functools.lru_cache(maxsize=1)
+def _load_workflow_config(config_mtime_ns: Optional[int]) -> Dict[str, Any]:
+    """設定ファイルのworkflowセクションを読み込む（更新時刻が同じ間は使い回す）"""
+    return ConfigManager().config['workflow']
+
+def configure_gemini_from_config() -> str:
+    """
+    設定ファイルのAPIキーでGemini APIを構成し、使用するモデル名を返す
+
+    設定ファイルが更新されていなければ、前回読み込んだ内容を使い回します。
+    """
+    try:
+        mtime_ns = os.stat(CONFIG_FILE).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    workflow = _load_workflow_config(mtime_ns)
+    configure_gemini(workflow.get('gemini_api_key'))
+    return workflow.get('gemini_model', DEFAULT_MODEL)
+
+@functools.lru_cache(maxsize=None)
+def _get_model(model_name: str) -> genai.GenerativeModel:
+    """モデル名ごとにGenerativeModelを使い回す"""
+    return genai.GenerativeModel(model_name)
+
+def _upload_file(file_path: str):
+    """
+    ファイルをGeminiにアップロードする（内容が変わっていなければ前回のアップロードを再利用）
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    cached = _uploaded_files.get(key)
+    if cached and time.time() - cached[0] < UPLOADED_FILE_TTL:
+        logger.info(f"アップロード済みのファイルを再利用します: {file_path}")
+        return cached[1]
 
-def call_gemini_api(prompt: str, file_path: Optional[str] = None, model_name: str = DEFAULT_MODEL) -> str:
+    logger.info(f"ファイルをアップロード中: {file_path}")
+    uploaded_file = genai.upload_file(file_path)
+    _uploaded_files[key] = (time.time(), uploaded_file)
+    return uploaded_file
+
+def _cache_key(prompt: str, file_path: Optional[str], model_name: str) -> str:
+    """モデル名・プロンプト・ファイル内容からキャッシュキーを生成する"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(model_name.encode('utf-8'))
+    h.update(b'\0')
+    h.update(prompt.encode('utf-8'))
+    if file_path:
+        h.update(b'\0')
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+def _read_cache(key: str) -> Optional[str]:
+    """有効期限内のキャッシュがあれば応答テキストを返す"""
+    path = GEMINI_CACHE_DIR / f"{key}.txt"
+    try:
+        if time.time() - path.stat().st_mtime > GEMINI_CACHE_MAX_AGE:
+            return None
+        return path.read_bytes().decode('utf-8')
+    except OSError:
+        return None
+
+def _write_cache(key: str, text: str):
+    """応答テキストをキャッシュに保存する（失敗しても処理は継続）"""
+    try:
+        GEMINI_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        (GEMINI_CACHE_DIR / f"{key}.txt").write_bytes(text.encode('utf-8'))
+    except OSError as e:
+        logger.warning(f"Gemini応答のキャッシュ保存に失敗しました: {e}")
+
+def _delete_cache(key: str):
+    """キャッシュエントリを削除する"""
+    try:
+        (GEMINI_CACHE_DIR / f"{key}.txt").unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"キャッシュの削除に失敗しました: {e}")
+
+def clear_gemini_cache() -> int:
+    """
+    Gemini応答のキャッシュをすべて削除する
+
+    Returns:
+        削除したエントリ数
+    """
+    removed = 0
+    if GEMINI_CACHE_DIR.exists():
+        for path in GEMINI_CACHE_DIR.glob("*.txt"):
+            try:
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                logger.warning(f"キャッシュの削除に失敗しました: {path} ({e})")
+    logger.info(f"Gemini応答のキャッシュを削除しました: {removed}件")
+    return removed
+
+def call_gemini_api(prompt: str, file_path: Optional[str] = None, model_name: str = DEFAULT_MODEL,
+                    use_cache: bool = True,
+                    validate: Optional[Callable[[str], Any]] = None) -> str:
     """
     Gemini APIを呼び出してテキストを生成する
+
+    use_cacheがTrueの場合、同じモデル・プロンプト・ファイルに対する過去の応答を再利用する。
+    validateを指定した場合、応答はvalidate(text)が例外を送出しなかったときだけキャッシュし、
+    検証に失敗するキャッシュは削除して再取得する（検証エラーはそのまま呼び出し元へ送出する）。
+    use_cacheがFalseの場合もvalidateがあれば、検証を通った新しい応答でキャッシュを上書きする。
     """
+    key = None
+    if use_cache or validate:
+        key = _cache_key(prompt, file_path, model_name)
+    if use_cache:
+        cached = _read_cache(key)
+        if cached is not None:
+            try:
+                if validate:
+                    validate(cached)
+                logger.info("キャッシュされたGemini応答を使用します")
+                return cached
+            except Exception as e:
+                logger.warning(f"キャッシュされたGemini応答が無効なため破棄します: {e}")
+                _delete_cache(key)
+
     try:
-        model = genai.GenerativeModel(model_name)
+        model = _get_model(model_name)
         
         contents = [prompt]
         
         if file_path:
             # ファイル（PDF等）をアップロードして内容に含める
-            logger.info(f"ファイルをアップロード中: {file_path}")
-            uploaded_file = genai.upload_file(file_path)
-            contents.append(uploaded_file)
+            contents.append(_upload_file(file_path))
             
         response = model.generate_content(contents)
-        return response.text
+        text = response.text
     except Exception as e:
         logger.error(f"Gemini API呼び出しエラー: {e}")
         raise
 
+    if validate:
+        # 検証に失敗した応答はキャッシュしない
+        validate(text)
+    if key:
+        _write_cache(key, text)
+    return text
+
 def extract_json_from_text(text: str) -> Dict[str, Any]:
     """
     テキストからJSON部分を抽出してパースする
     """
-    # JSONコードブロックを探す
-    if "```json" in text:
-        start = text.find("```json") + 7
-        end = text.find("```", start)
-        json_str = text[start:end].strip()
-    elif "```" in text:
-        start = text.find("```") + 3
-        end = text.find("```", start)
-        json_str = text[start:end].strip()
-    else:
-        json_str = text.strip()
+    # JSONコードブロックを探す（閉じフェンスが欠けた応答は末尾までを対象とする）
+    match = _JSON_FENCE.search(text)
+    json_str = match.group(1) if match else text.strip()
 
     try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
+        return json_utils.loads(json_str)
+    except json.JSONDecodeError as e:  # orjson.JSONDecodeErrorもこのサブクラス
         logger.error(f"JSON解析エラー: {e}")
-        logger.debug(f"解析対象テキスト: {json_str}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"解析対象テキスト: {json_str}")
         raise ValueError(f"Geminiの出力が正しいJSON形式ではありません: {e}")
\ No newline at end of file
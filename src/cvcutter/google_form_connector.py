@@ -14,6 +14,7 @@ import json
 import logging
 import pickle
 import sys
+import time
 from pathlib import Path
 from typing import Dict, List, Optional
 from datetime import datetime
@@ -23,6 +24,7 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from .video_utils import get_app_data_path
+from .json_utils import load_json, save_json
 
 # ログ設定
 logging.basicConfig(
@@ -41,6 +43,9 @@ CLIENT_SECRETS_FILE = get_app_data_path("client_secrets.json")
 FORMS_TOKEN_PICKLE = get_app_data_path("forms_token.pickle")
 FORM_CONFIG_FILE = get_app_data_path("form_config.json")
 
+# Forms APIの回答キャッシュの有効期間（秒）
+FORM_CACHE_MAX_AGE = 300
+
 
 class FormResponseParser:
     """Googleフォーム回答パーサー"""
@@ -65,6 +70,7 @@ class FormResponseParser:
         """
         self.csv_path = csv_path
         self.responses = []
+        self.form_id = None
 
     def _find_column_index(self, headers: List[str], column_key: str) -> Optional[int]:
         """
@@ -346,12 +352,46 @@ class FormResponseParser:
 
         return build(service_name, version, credentials=credentials)
 
-    def load_from_forms_api(self, form_id: Optional[str] = None) -> List[Dict]:
+    def _load_cached_responses(self, cache_path: Path, form_id: str,
+                               max_age: float) -> Optional[List[Dict]]:
+        """
+        有効期間内のForms API回答キャッシュを読み込み
+
+        Args:
+            cache_path: キャッシュJSONファイルのパス
+            form_id: フォームID
+            max_age: キャッシュの有効期間（秒）
+
+        Returns:
+            回答データのリスト（キャッシュが無効な場合はNone）
+        """
+        if not cache_path.exists():
+            return None
+
+        if time.time() - cache_path.stat().st_mtime > max_age:
+            return None
+
+        try:
+            cached = load_json(cache_path)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"回答キャッシュの読み込みに失敗しました: {e}")
+            return None
+
+        if cached.get("form_id") != form_id:
+            return None
+
+        return cached.get("responses", [])
+
+    def load_from_forms_api(self, form_id: Optional[str] = None,
+                            cache_path: Optional[Path] = None,
+                            max_cache_age: float = FORM_CACHE_MAX_AGE) -> List[Dict]:
         """
         Google Forms APIから回答を直接取得
 
         Args:
             form_id: フォームID（指定しない場合はform_config.jsonから読み込み）
+            cache_path: 回答キャッシュのJSONファイルパス（オプション）
+            max_cache_age: キャッシュの有効期間（秒）
 
         Returns:
             回答データのリスト
@@ -373,6 +413,16 @@ class FormResponseParser:
             if not form_id:
                 raise ValueError("form_config.jsonにform_idが含まれていません")
 
+        self.form_id = form_id
+
+        # 同一フォームの新しいキャッシュがあればAPI呼び出しを省略
+        if cache_path:
+            cached = self._load_cached_responses(cache_path, form_id, max_cache_age)
+            if cached is not None:
+                logger.info(f"キャッシュされた回答を使用します: {cache_path} ({len(cached)}件)")
+                self.responses = cached
+                return cached
+
         logger.info(f"Google Forms APIから回答を取得しています...")
         logger.info(f"フォームID: {form_id}")
 
@@ -416,6 +466,9 @@ class FormResponseParser:
             self.responses = responses
             logger.info(f"\n{len(responses)}件の有効な回答を取得しました")
 
+            if cache_path:
+                self.export_to_json(cache_path)
+
             return responses
 
         except HttpError as e:
@@ -552,10 +605,11 @@ class FormResponseParser:
             "response_count": len(self.responses),
             "responses": self.responses
         }
+        if self.form_id:
+            output_data["form_id"] = self.form_id
 
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
+        save_json(output_data, output_path)
 
         logger.info(f"回答データをエクスポートしました: {output_path}")
 
@@ -0,0 +1,51 @@
+"""
+JSON読み書きユーティリティ
+
+orjson（依存パッケージ）を使用し、インポートできない環境では標準のjsonにフォールバックします。
+どちらの場合もUTF-8のバイト列として読み書きするため、テキストモードのエンコード処理を経由しません。
+解析エラーはどちらの場合もjson.JSONDecodeErrorとして送出されます。
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """JSON文字列（またはUTF-8バイト列）を解析する"""
+    if orjson is not None:
+        # orjson.JSONDecodeErrorはjson.JSONDecodeErrorのサブクラス
+        return orjson.loads(data)
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        # orjsonと同じくUTF-8のみを受け付け、不正なバイト列もJSONDecodeErrorとして扱う
+        try:
+            data = bytes(data).decode('utf-8')
+        except UnicodeDecodeError as e:
+            raise json.JSONDecodeError(f"UTF-8として不正なバイト列です: {e.reason}",
+                                       bytes(data).decode('utf-8', errors='replace'), e.start) from e
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: bool = True) -> bytes:
+    """オブジェクトをUTF-8のJSONバイト列に変換する（非ASCII文字はそのまま出力）"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None).encode('utf-8')
+
+
+def load_json(path: Union[str, Path]) -> Any:
+    """JSONファイルを読み込む"""
+    return loads(Path(path).read_bytes())
+
+
+def save_json(obj: Any, path: Union[str, Path], indent: bool = True):
+    """オブジェクトをJSONファイルに保存する"""
+    Path(path).write_bytes(dumps(obj, indent=indent))
@@ -10,10 +10,11 @@ PDF解析スクリプト（Gemini API使用）
 
 import json
 import logging
+import sys
 from pathlib import Path
 from typing import Dict, List, Optional
-from .gemini_utils import call_gemini_api, extract_json_from_text, configure_gemini
-from .config_manager import ConfigManager
+from .gemini_utils import call_gemini_api, extract_json_from_text, configure_gemini_from_config, clear_gemini_cache
+from .json_utils import load_json, save_json
 
 # ログ設定
 logging.basicConfig(
@@ -22,6 +23,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 各演奏データに必須のキー
+_REQUIRED_PERF_KEYS = ("program_order", "performer_name", "piece_title")
+
 # Gemini API のプロンプト
 GEMINI_PROMPT = """
 このPDFはピアノコンサートのパンフレットです。
@@ -68,13 +72,15 @@ GEMINI_PROMPT = """
 """
 
 
-def parse_pdf_with_gemini(pdf_path: Path, prompt: str = GEMINI_PROMPT) -> Optional[str]:
+def parse_pdf_with_gemini(pdf_path: Path, prompt: str = GEMINI_PROMPT,
+                          use_cache: bool = True) -> Optional[str]:
     """
     Gemini APIを使用してPDFを解析
 
     Args:
         pdf_path: 解析する PDF ファイルのパス
         prompt: Gemini API に送るプロンプト
+        use_cache: 同一PDF・プロンプトに対するGemini応答のキャッシュを使用するか
 
     Returns:
         Gemini API の出力（JSON 文字列を含む）
@@ -85,20 +91,12 @@ def parse_pdf_with_gemini(pdf_path: Path, prompt: str = GEMINI_PROMPT) -> Option
     logger.info(f"PDFを解析しています: {pdf_path}")
 
     try:
-        # APIキーの取得と設定
-        config = ConfigManager().config
-        api_key = config['workflow'].get('gemini_api_key')
-        if not api_key:
-            raise ValueError("Gemini APIキーが設定されていません。設定画面から入力してください。")
-        
-        configure_gemini(api_key)
+        # APIキーの設定と、設定からモデル名を取得
+        model_name = configure_gemini_from_config()
         
         # API呼び出し
-        # 設定からモデル名を取得
-        model_name = config['workflow'].get('gemini_model', 'gemini-2.5-flash')
-        
-        # API呼び出し
-        output = call_gemini_api(prompt, file_path=str(pdf_path), model_name=model_name)
+        output = call_gemini_api(prompt, file_path=str(pdf_path), model_name=model_name,
+                                 use_cache=use_cache, validate=_check_gemini_output)
         
         logger.debug(f"Gemini API出力: {output[:200]}...")  # 最初の200文字のみログ
 
@@ -111,36 +109,15 @@ def parse_pdf_with_gemini(pdf_path: Path, prompt: str = GEMINI_PROMPT) -> Option
 
 def extract_json_from_output(output: str) -> Dict:
     """
-    Gemini CLIの出力からJSON部分を抽出
+    Geminiの出力からJSON部分を抽出（gemini_utils.extract_json_from_text の互換エイリアス）
 
     Args:
-        output: Gemini CLIの出力
+        output: Geminiの出力
 
     Returns:
         解析されたJSON辞書
     """
-    # JSONコードブロックを探す
-    if "```json" in output:
-        # ```json ... ``` の形式
-        start = output.find("```json") + 7
-        end = output.find("```", start)
-        json_str = output[start:end].strip()
-    elif "```" in output:
-        # ``` ... ``` の形式
-        start = output.find("```") + 3
-        end = output.find("```", start)
-        json_str = output[start:end].strip()
-    else:
-        # コードブロックなし、全体をJSONとして扱う
-        json_str = output.strip()
-
-    try:
-        data = json.loads(json_str)
-        return data
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON解析エラー: {e}")
-        logger.error(f"解析しようとした文字列:\n{json_str[:500]}")
-        raise ValueError(f"Gemini CLIの出力がJSON形式ではありません: {e}")
+    return extract_json_from_text(output)
 
 
 def validate_program_data(data: Dict) -> bool:
@@ -165,31 +142,75 @@ def validate_program_data(data: Dict) -> bool:
 
     # 各演奏データの検証
     for i, perf in enumerate(performances, 1):
-        required_keys = ["program_order", "performer_name", "piece_title"]
-        for key in required_keys:
-            if key not in perf or not perf[key]:
-                logger.warning(f"演奏 {i}: '{key}'が欠落しています")
+        missing = [key for key in _REQUIRED_PERF_KEYS if not perf.get(key)]
+        if missing:
+            logger.warning(f"演奏 {i}: {', '.join(missing)}が欠落しています")
 
     return True
 
 
-def parse_concert_pdf(pdf_path: Path, output_json: Optional[Path] = None) -> Dict:
+def _check_gemini_output(output: str):
+    """Geminiの出力がプログラム情報として有効か検証する（無効ならValueError。キャッシュ可否の判定に使用）"""
+    if not validate_program_data(extract_json_from_output(output)):
+        raise ValueError("抽出されたプログラムデータが無効です")
+
+
+def load_cached_program(pdf_path: Path, output_json: Optional[Path]) -> Optional[Dict]:
+    """
+    PDFより新しい解析結果JSONがあれば読み込む
+
+    Args:
+        pdf_path: PDFファイルのパス
+        output_json: 解析結果のJSONファイルパス
+
+    Returns:
+        キャッシュされたプログラム情報（無効な場合はNone）
+    """
+    if not output_json or not output_json.exists() or not pdf_path.exists():
+        return None
+
+    if output_json.stat().st_mtime < pdf_path.stat().st_mtime:
+        return None
+
+    try:
+        program_data = load_json(output_json)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"キャッシュの読み込みに失敗しました: {e}")
+        return None
+
+    if not validate_program_data(program_data):
+        return None
+
+    return program_data
+
+
+def parse_concert_pdf(pdf_path: Path, output_json: Optional[Path] = None,
+                      force_reparse: bool = False, use_cache: bool = True) -> Dict:
     """
     コンサートパンフレットPDFを解析してプログラム情報を抽出
 
     Args:
         pdf_path: PDFファイルのパス
         output_json: 結果を保存するJSONファイルパス（オプション）
+        force_reparse: Trueの場合、保存済みの解析結果があっても再解析する
+        use_cache: Gemini応答のキャッシュを使用するか
 
     Returns:
         抽出されたプログラム情報（辞書）
     """
+    # PDFより新しい解析結果があればGemini呼び出しを省略
+    if not force_reparse:
+        cached = load_cached_program(pdf_path, output_json)
+        if cached is not None:
+            logger.info(f"保存済みの解析結果を使用します: {output_json}")
+            return cached
+
     logger.info("=" * 60)
     logger.info("PDF解析開始")
     logger.info("=" * 60)
 
     # Gemini API で PDF を解析
-    gemini_output = parse_pdf_with_gemini(pdf_path)
+    gemini_output = parse_pdf_with_gemini(pdf_path, use_cache=use_cache)
 
     # JSON 部分を抽出
     logger.info("Gemini の出力から JSON を抽出しています...")
@@ -200,19 +221,21 @@ def parse_concert_pdf(pdf_path: Path, output_json: Optional[Path] = None) -> Dic
         raise ValueError("抽出されたプログラムデータが無効です")
 
     # 結果をログ出力
-    logger.info(f"\n抽出された演奏プログラム: {len(program_data['performances'])}件")
-    for perf in program_data["performances"]:
-        logger.info(
+    performances = program_data["performances"]
+    logger.info(
+        f"\n抽出された演奏プログラム: {len(performances)}件\n" +
+        "\n".join(
             f"  {perf.get('program_order')}. "
             f"{perf.get('performer_name')} - "
             f"{perf.get('piece_title')}"
+            for perf in performances
         )
+    )
 
     # JSONファイルに保存（指定されている場合）
     if output_json:
         output_json.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_json, 'w', encoding='utf-8') as f:
-            json.dump(program_data, f, ensure_ascii=False, indent=2)
+        save_json(program_data, output_json)
         logger.info(f"\n結果を保存しました: {output_json}")
 
     logger.info("=" * 60)
@@ -246,34 +269,56 @@ def main():
         default=GEMINI_PROMPT,
         help="カスタムプロンプト（オプション）"
     )
+    parser.add_argument(
+        "--force-reparse",
+        action="store_true",
+        help="保存済みの解析結果を無視してPDFを再解析"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Gemini応答のキャッシュを使用しない"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="実行前にGemini応答のキャッシュを削除"
+    )
 
     args = parser.parse_args()
 
+    if args.clear_cache:
+        clear_gemini_cache()
+
     # 出力ファイル名のデフォルト設定
     if args.output is None:
         args.output = args.pdf_file.parent / f"{args.pdf_file.stem}_program.json"
 
     try:
-        program_data = parse_concert_pdf(args.pdf_file, args.output)
+        program_data = parse_concert_pdf(
+            args.pdf_file, args.output,
+            force_reparse=args.force_reparse,
+            use_cache=not args.no_cache
+        )
 
-        # 簡易的な結果表示
-        print("\n" + "=" * 60)
-        print("抽出された演奏プログラム")
-        print("=" * 60)
+        # 簡易的な結果表示（まとめて1回で出力）
+        lines = ["", "=" * 60, "抽出された演奏プログラム", "=" * 60]
 
         if "concert_info" in program_data:
             info = program_data["concert_info"]
-            print(f"コンサート: {info.get('title', 'N/A')}")
-            print(f"日時: {info.get('date', 'N/A')}")
-            print(f"会場: {info.get('venue', 'N/A')}")
-            print()
+            lines.append(f"コンサート: {info.get('title', 'N/A')}")
+            lines.append(f"日時: {info.get('date', 'N/A')}")
+            lines.append(f"会場: {info.get('venue', 'N/A')}")
+            lines.append("")
 
         for perf in program_data["performances"]:
-            print(f"{perf.get('program_order')}. {perf.get('performer_name')}")
-            print(f"   {perf.get('piece_title')}")
+            lines.append(f"{perf.get('program_order')}. {perf.get('performer_name')}")
+            lines.append(f"   {perf.get('piece_title')}")
             if perf.get('piece_composer'):
-                print(f"   作曲: {perf.get('piece_composer')}")
-            print()
+                lines.append(f"   作曲: {perf.get('piece_composer')}")
+            lines.append("")
+
+        sys.stdout.write("\n".join(lines) + "\n")
 
     except KeyboardInterrupt:
         logger.info("\n中断されました")
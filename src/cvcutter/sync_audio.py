@@ -2,9 +2,16 @@ import librosa
 import numpy as np
 import os
 import argparse
-from scipy.signal import correlate
+from scipy.fft import irfft, next_fast_len, rfft
+from scipy.signal import correlate, decimate
 
-def find_anchor(audio, sr, duration_s=15):
+# 粗い検索で音声を間引く倍率（同期の手がかりになる音の立ち上がりは低い周波数帯に集中している）
+DECIMATE_FACTOR = 4
+
+# needleから切り出すアンカーの長さ（秒）
+ANCHOR_SECONDS = 15
+
+def find_anchor(audio, sr, duration_s=ANCHOR_SECONDS):
     """音声内で最も音量が大きい部分をアンカーとして切り出す"""
     frame_size = int(sr * 0.1) # 0.1秒ごとのエネルギーを計算
     hop_size = int(sr * 0.05)
@@ -29,57 +36,209 @@ def find_anchor(audio, sr, duration_s=15):
     print(f"最も特徴的な部分（アンカー）を {start_sample/sr:.2f}秒地点から {duration_s}秒間 切り出しました。")
     return anchor_audio, start_sample
 
-def find_audio_offset(haystack_path, needle_path, target_sr):
+def _describe_source(source, sr):
+    """ログ表示用に音声の入力元を表す文字列を返す"""
+    if isinstance(source, np.ndarray):
+        return f"<メモリ上の音声 {len(source) / sr:.1f}秒>"
+    return os.path.basename(source)
+
+def _load_audio(source, sr):
+    """ファイルパスなら読み込み、numpy配列（sr でデコード済み）ならそのまま返す"""
+    if isinstance(source, np.ndarray):
+        return source
+    audio, _ = librosa.load(source, sr=sr)
+    return audio
+
+def _parabolic_peak_offset(values, index):
+    """ピークとその前後の3点に放物線を当てはめ、サブサンプル単位のピーク位置のずれ（-0.5〜0.5）を返す"""
+    if index <= 0 or index >= len(values) - 1:
+        return 0.0
+    left, center, right = values[index - 1], values[index], values[index + 1]
+    denominator = left - 2 * center + right
+    if denominator == 0:
+        return 0.0
+    return float(0.5 * (left - right) / denominator)
+
+def _normalize(audio):
+    """平均0・分散1に正規化する"""
+    return (audio - np.mean(audio)) / np.std(audio)
+
+class AudioSyncer:
     """
-    アンカー検索を用いて、2つの音声ファイルのオフセットを高精度に計算する。
+    1つの基準音声（haystack）の中で、複数のneedleの位置を探すための同期器。
+    haystackの間引き・正規化・FFTは生成時に一度だけ計算し、needleごとの検索で使い回す。
+
+    元のレートの波形は精密な検索の範囲だけあれば足りるため、長い録音では from_decimated で
+    間引いた波形と区間の読み出し関数を渡し、元のレートの波形全体をメモリに置かないようにする。
     """
-    print(f"\n--- 音声同期を開始します (アンカー検索モード) ---")
-    print(f"基準音声 (haystack): {os.path.basename(haystack_path)}")
-    print(f"対象音声 (needle): {os.path.basename(needle_path)}")
-    print(f"処理レート: {target_sr} Hz")
 
-    try:
-        # 1. 音声ファイルを読み込み
-        print("Haystackファイルを読み込み中...")
-        haystack_audio, _ = librosa.load(haystack_path, sr=target_sr)
-        
-        print("Needleファイルを読み込み中...")
-        needle_audio, _ = librosa.load(needle_path, sr=target_sr)
-        
-        # 2. Needleからアンカー（最も特徴的な部分）を切り出す
-        anchor_audio, anchor_start_in_needle = find_anchor(needle_audio, target_sr)
+    def __init__(self, haystack_audio, sr, factor=DECIMATE_FACTOR):
+        haystack_audio = np.asarray(haystack_audio, dtype=np.float32)
+        haystack_ds = None
+        max_anchor = int(ANCHOR_SECONDS * sr)
+        if factor > 1 and max_anchor >= factor * 64 and len(haystack_audio) >= max_anchor:
+            haystack_ds = decimate(haystack_audio, factor, ftype='fir')
+        self._setup(sr, sr / factor, haystack_ds, len(haystack_audio),
+                    lambda start, end: haystack_audio[start:end])
 
-        # 3. 音量を正規化
-        print("波形を正規化中...")
-        haystack_norm = (haystack_audio - np.mean(haystack_audio)) / np.std(haystack_audio)
-        anchor_norm = (anchor_audio - np.mean(anchor_audio)) / np.std(anchor_audio)
+    @classmethod
+    def from_decimated(cls, haystack_ds, ds_rate, sr, read_window):
+        """
+        間引いた波形から同期器を作る。
+
+        Args:
+            haystack_ds: ds_rateでデコード済みのhaystack
+            ds_rate: haystack_dsのサンプリングレート
+            sr: 精密な検索に使うサンプリングレート
+            read_window: (開始サンプル, 終了サンプル) -> haystackのその区間をsrでデコードした波形
+        """
+        syncer = cls.__new__(cls)
+        syncer._setup(sr, ds_rate, haystack_ds, int(len(haystack_ds) * sr / ds_rate), read_window)
+        return syncer
+
+    def _setup(self, sr, ds_rate, haystack_ds, haystack_len, read_window):
+        self.sr = sr
+        self.ds_rate = ds_rate
+        self.haystack_len = haystack_len
+        self._read_haystack = read_window
+        self.haystack_fft = None
+        if haystack_ds is not None and len(haystack_ds) > 0:
+            # アンカーの最大長に合わせたFFT長で、間引いたhaystackのスペクトルを先に求めておく
+            self.haystack_ds_len = len(haystack_ds)
+            max_anchor_ds = int(np.ceil(ANCHOR_SECONDS * ds_rate))
+            self.nfft = next_fast_len(self.haystack_ds_len + max_anchor_ds - 1, real=True)
+            self.haystack_fft = rfft(_normalize(np.asarray(haystack_ds, dtype=np.float32)),
+                                     n=self.nfft, workers=-1)
+
+    def _search_window(self, anchor_ds, anchor_len):
+        """
+        間引いた波形同士の相関で大まかな一致位置を求め、元のレートで精密に探す範囲
+        (開始, 終了) を返す。間引きが使えない場合は全体を範囲とする。
+        """
+        if (self.haystack_fft is None or anchor_ds is None or len(anchor_ds) < 64
+                or self.haystack_ds_len < len(anchor_ds)):
+            return 0, self.haystack_len
+        # haystackのスペクトルとアンカーのスペクトルの共役の積 → 相互相関（循環しない範囲のみ使う）
+        coarse = irfft(self.haystack_fft * np.conj(rfft(_normalize(anchor_ds), n=self.nfft, workers=-1)),
+                       n=self.nfft, workers=-1)[:self.haystack_ds_len - len(anchor_ds) + 1]
+        ratio = self.sr / self.ds_rate
+        coarse_lag = int(round(int(np.argmax(coarse)) * ratio))
+        # 間引きによる位置のずれ（±数サンプル程度）を見込んで前後に余裕を持たせる
+        margin = 2 * int(np.ceil(ratio))
+        start = max(0, coarse_lag - margin)
+        end = min(self.haystack_len, coarse_lag + margin + anchor_len)
+        return start, end
+
+    def find(self, needle_audio):
+        """
+        needleがhaystackのどこから始まるかを求める。
+        戻り値は find_audio_offset と同じ形式の辞書（失敗時はNone）。
+        """
+        try:
+            # 1. Needleからアンカー（最も特徴的な部分）を切り出す
+            anchor_audio, anchor_start_in_needle = find_anchor(needle_audio, self.sr)
+            factor = int(round(self.sr / self.ds_rate))
+            anchor_ds = None
+            if self.haystack_fft is not None and len(anchor_audio) >= factor * 64:
+                anchor_ds = decimate(_normalize(anchor_audio), factor, ftype='fir')
+            return self._locate(anchor_audio, anchor_start_in_needle, anchor_ds)
+        except Exception as e:
+            import traceback
+            print(f"音声同期中にエラーが発生しました: {e}")
+            traceback.print_exc()
+            return None
+
+    def find_decimated(self, needle_ds, read_needle):
+        """
+        間引いたneedleから位置を求める（needleの元のレートの波形はアンカーの区間だけ読み出す）。
+
+        Args:
+            needle_ds: haystackと同じds_rateでデコード済みのneedle
+            read_needle: (開始サンプル, 終了サンプル) -> needleのその区間をsrでデコードした波形
+        """
+        try:
+            # 1. 間引いた波形でアンカー（最も特徴的な部分）の位置を決め、その区間だけ元のレートで読み出す
+            anchor_ds, anchor_start_ds = find_anchor(needle_ds, self.ds_rate)
+            ratio = self.sr / self.ds_rate
+            anchor_start_in_needle = int(round(anchor_start_ds * ratio))
+            anchor_audio = read_needle(anchor_start_in_needle,
+                                       anchor_start_in_needle + int(round(len(anchor_ds) * ratio)))
+            return self._locate(anchor_audio, anchor_start_in_needle, anchor_ds)
+        except Exception as e:
+            import traceback
+            print(f"音声同期中にエラーが発生しました: {e}")
+            traceback.print_exc()
+            return None
 
-        # 4. クロス相関でアンカーをHaystackから探す
+    def _locate(self, anchor_audio, anchor_start_in_needle, anchor_ds):
+        """アンカーをhaystackから探し、needleのオフセットを求める"""
+        # 2. 音量を正規化
+        anchor_norm = _normalize(anchor_audio)
+
+        # 3. クロス相関でアンカーをHaystackから探す
+        #    まず間引いた波形で大まかな位置を求め、元のレートではその周辺だけを読み出して探す
+        #    （相関のピーク位置と一致度はhaystack側の平均・スケールに依存しないため、区間は正規化しない）
         print("アンカーをHaystack内で検索中...")
-        correlation = correlate(haystack_norm, anchor_norm, mode='valid')
-        
-        # 5. 最も相関が高かった位置（ラグ）を見つける
-        lag_in_haystack = np.argmax(correlation)
-        
-        # 6. 最終的なオフセットを計算
+        search_start, search_end = self._search_window(anchor_ds, len(anchor_norm))
+        window = np.asarray(self._read_haystack(search_start, search_end), dtype=np.float32)
+        correlation = correlate(window, anchor_norm, mode='valid', method='fft')
+
+        # 4. 最も相関が高かった位置（ラグ）を見つける
+        peak = int(np.argmax(correlation))
+        lag_in_haystack = search_start + peak
+
+        # 一致した区間とアンカーの相関係数（-1〜1）を一致度として求める
+        # （アンカーは平均0・分散1に正規化済みなので、区間側の標準偏差だけで割ればよい）
+        window_std = np.std(window[peak:peak + len(anchor_norm)])
+        confidence = float(correlation[peak] / (len(anchor_norm) * window_std)) if window_std > 0 else 0.0
+
+        # 5. 最終的なオフセットを計算
         #    Needleの開始位置 = (Haystackで見つかったアンカーの位置) - (Needle内でのアンカーの開始位置)
+        #    秒単位のオフセットはピーク前後の相関値から1サンプル未満の精度で補間する
         final_offset_samples = lag_in_haystack - anchor_start_in_needle
-        final_offset_seconds = float(final_offset_samples) / target_sr
+        final_offset_seconds = (final_offset_samples + _parabolic_peak_offset(correlation, peak)) / self.sr
 
         print(f"\n計算完了: NeedleはHaystackの {final_offset_seconds:.4f} 秒地点から始まります。")
         print(f"（正の値はNeedleが遅れて始まることを、負の値はNeedleが先行して始まることを意味します）")
-        
+        print(f"一致度（相関係数）: {confidence:.3f}")
+
         return {
             'offset_seconds': final_offset_seconds,
             'offset_samples': final_offset_samples,
+            'confidence': confidence,
         }
 
+def find_audio_offset(haystack_path, needle_path, target_sr):
+    """
+    アンカー検索を用いて、2つの音声ファイルのオフセットを高精度に計算する。
+    haystack_path / needle_path にはファイルパスの代わりに、target_sr でデコード済みの
+    モノラル numpy 配列を渡すこともできる。
+    同じhaystackに対して繰り返し検索する場合は AudioSyncer を直接使うこと。
+    """
+    print(f"\n--- 音声同期を開始します (アンカー検索モード) ---")
+    print(f"基準音声 (haystack): {_describe_source(haystack_path, target_sr)}")
+    print(f"対象音声 (needle): {_describe_source(needle_path, target_sr)}")
+    print(f"処理レート: {target_sr} Hz")
+
+    try:
+        # 音声ファイルを読み込み
+        print("Haystackファイルを読み込み中...")
+        haystack_audio = _load_audio(haystack_path, target_sr)
+        
+        print("Needleファイルを読み込み中...")
+        needle_audio = _load_audio(needle_path, target_sr)
+
+        print("波形を正規化中...")
+        syncer = AudioSyncer(haystack_audio, target_sr)
+
     except Exception as e:
         import traceback
         print(f"音声同期中にエラーが発生しました: {e}")
         traceback.print_exc()
         return None
 
+    return syncer.find(needle_audio)
+
 def plot_verification(haystack_path, needle_path, sr, offset_seconds):
 
     """
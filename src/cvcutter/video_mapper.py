@@ -13,12 +13,18 @@ YouTubeアップロード用のメタデータを生成します。
 """
 
 import logging
+import os
+import sys
+import unicodedata
+from itertools import zip_longest
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
 import json
-from .gemini_utils import call_gemini_api, extract_json_from_text, configure_gemini
-from .config_manager import ConfigManager
+
+from rapidfuzz import fuzz, process as rf_process
+from .gemini_utils import call_gemini_api, extract_json_from_text, configure_gemini_from_config, clear_gemini_cache
+from .json_utils import load_json, save_json
 
 # ログ設定
 logging.basicConfig(
@@ -27,40 +33,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 動画として扱う拡張子（小文字）
+_VIDEO_EXTS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv'})
 
-def get_video_files_sorted(video_dir: Path) -> List[Dict]:
+# この類似度（0-100）以上の回答×プログラムはGeminiに問い合わせず一致とみなす
+AUTO_ACCEPT_SCORE = 90.0
+
+# Geminiに渡す候補プログラム数（回答ごとに文字列類似度の上位から選ぶ）
+PROMPT_CANDIDATES = 5
+
+# 最上位の候補でもこの類似度（0-100）に届かない回答は、全プログラムを渡して別途判定する
+CANDIDATE_MIN_SCORE = 40.0
+
+# 簡易マッチング（Gemini不使用時）で一致とみなす最低類似度（0-100）
+SIMPLE_MATCH_CUTOFF = 50.0
+
+
+def iter_video_files_sorted(video_dir: Path) -> Iterator[Dict]:
     """
-    動画ファイルをファイル名順にソート
+    動画ファイルをファイル名順に1件ずつ生成
+
+    os.scandirのDirEntryを使い、stat()は1ファイルにつき1回だけ取得します
+    （WindowsではDirEntryが走査時に取得したstat情報をキャッシュしているため追加のシステムコールは発生しません）。
 
     Args:
         video_dir: 動画ファイルのディレクトリ
 
-    Returns:
-        動画ファイル情報のリスト
+    Yields:
+        動画ファイル情報
     """
-    video_extensions = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv']
-    video_files = [
-        f for f in video_dir.iterdir()
-        if f.is_file() and f.suffix.lower() in video_extensions
-    ]
+    with os.scandir(video_dir) as it:
+        entries = [
+            (entry, entry.stat())
+            for entry in it
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in _VIDEO_EXTS
+        ]
 
     # ファイル名でソート
-    video_files.sort(key=lambda f: f.name)
+    entries.sort(key=lambda e: e[0].name)
 
-    video_info_list = []
-    for i, video_file in enumerate(video_files, 1):
-        ctime = datetime.fromtimestamp(video_file.stat().st_ctime)
-        video_info_list.append({
+    for i, (entry, st) in enumerate(entries, 1):
+        ctime = datetime.fromtimestamp(st.st_ctime)
+        yield {
             "file_order": i,
-            "file_path": str(video_file),
-            "file_name": video_file.name,
+            "file_path": str(video_dir / entry.name),
+            "file_name": entry.name,
             "created_time": ctime.isoformat(),
-            "created_timestamp": video_file.stat().st_ctime
-        })
+            "created_timestamp": st.st_ctime
+        }
+
+
+def get_video_files_sorted(video_dir: Path) -> List[Dict]:
+    """
+    動画ファイルをファイル名順にソート
+
+    Args:
+        video_dir: 動画ファイルのディレクトリ
+
+    Returns:
+        動画ファイル情報のリスト
+    """
+    video_info_list = list(iter_video_files_sorted(video_dir))
 
     logger.info(f"動画ファイル {len(video_info_list)}本を検出しました")
-    for info in video_info_list:
-        logger.info(f"  {info['file_order']}. {info['file_name']} ({info['created_time']})")
+    if logger.isEnabledFor(logging.INFO):
+        for info in video_info_list:
+            logger.info(f"  {info['file_order']}. {info['file_name']} ({info['created_time']})")
 
     return video_info_list
 
@@ -86,17 +124,14 @@ def map_program_to_videos(program_data: Dict, video_info_list: List[Dict]) -> Li
             f"プログラム数（{len(performances_sorted)}）と動画数（{len(video_info_list)}）が一致しません"
         )
 
-    # 順序で紐付け
+    # 順序で紐付け（数が合わない場合は足りない側をNoneとする）
     mappings = []
-    max_count = max(len(performances_sorted), len(video_info_list))
-
-    for i in range(max_count):
+    for i, (perf, video) in enumerate(zip_longest(performances_sorted, video_info_list), 1):
         mapping = {
-            "mapping_order": i + 1
+            "mapping_order": i
         }
 
-        if i < len(performances_sorted):
-            perf = performances_sorted[i]
+        if perf is not None:
             mapping["program_data"] = perf
             mapping["performer_name"] = perf.get("performer_name", "")
             mapping["piece_title"] = perf.get("piece_title", "")
@@ -104,8 +139,7 @@ def map_program_to_videos(program_data: Dict, video_info_list: List[Dict]) -> Li
         else:
             mapping["program_data"] = None
 
-        if i < len(video_info_list):
-            video = video_info_list[i]
+        if video is not None:
             mapping["video_data"] = video
             mapping["video_file"] = video["file_path"]
             mapping["video_name"] = video["file_name"]
@@ -116,12 +150,15 @@ def map_program_to_videos(program_data: Dict, video_info_list: List[Dict]) -> Li
         mappings.append(mapping)
 
     logger.info(f"\nプログラム→動画の紐付け: {len(mappings)}件")
+    # INFOが無効な場合は一致した行のf-string組み立てを省略する（警告は常に出力）
+    log_info = logger.isEnabledFor(logging.INFO)
     for m in mappings:
         if m["program_data"] and m["video_data"]:
-            logger.info(
-                f"  {m['mapping_order']}. {m['performer_name']} / {m['piece_title']} "
-                f"→ {m['video_name']}"
-            )
+            if log_info:
+                logger.info(
+                    f"  {m['mapping_order']}. {m['performer_name']} / {m['piece_title']} "
+                    f"→ {m['video_name']}"
+                )
         elif m["program_data"]:
             logger.warning(f"  {m['mapping_order']}. {m['performer_name']} → 動画なし")
         elif m["video_data"]:
@@ -130,47 +167,123 @@ def map_program_to_videos(program_data: Dict, video_info_list: List[Dict]) -> Li
     return mappings
 
 
-def map_with_form_responses(
-    program_video_mappings: List[Dict],
-    form_responses: List[Dict],
-    use_gemini: bool = True
-) -> List[Dict]:
+def _normalize_text(text: Optional[str]) -> str:
     """
-    プログラム+動画情報とアンケート回答を紐付け（一括AIマッピング対応）
+    照合用に文字列を正規化（NFKC正規化＋空白の統一）
+
+    全角英数字や連続する空白の揺れを吸収し、同じ入力から同じプロンプトが生成されるようにする
     """
-    if not use_gemini:
-        # Geminiを使わない場合の簡易マッチング（フォールバック）
-        return _map_simple(program_video_mappings, form_responses)
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
 
-    logger.info("\n" + "=" * 60)
-    logger.info("アンケート回答との一括AI紐付けを開始します")
-    logger.info("=" * 60)
 
-    # 有効なプログラム情報のリストを作成
-    program_list = []
-    for m in program_video_mappings:
-        if m.get("program_data") and m.get("video_data"):
-            program_list.append({
-                "mapping_order": m["mapping_order"],
-                "performer_name": m.get("performer_name", ""),
-                "piece_title": m.get("piece_title", ""),
-                "video_name": m.get("video_name", "")
-            })
+def _match_key(text: Optional[str]) -> str:
+    """類似度計算用のキー（正規化＋小文字化）"""
+    return _normalize_text(text).lower()
 
-    if not program_list or not form_responses:
-        logger.warning("マッピング対象のデータが不足しています")
-        return []
 
-    prompt = f"""
-あなたはピアノコンサートの運営スタッフです。
-「プログラム情報」と「演奏者からのアンケート回答」を照合し、どのアンケート回答がどのプログラム（動画）に対応するかを紐付けてください。
+def _score_matrix(response_list: List[Dict], program_list: List[Dict]) -> List[List[float]]:
+    """
+    アンケート回答×プログラムの類似度行列を計算（0-100、氏名と曲名の類似度の平均）
 
-【プログラム情報（動画紐付け済み）】
-{json.dumps(program_list, ensure_ascii=False, indent=2)}
+    氏名はtoken_set_ratio、曲名はpartial_ratioで比較し、rapidfuzzのcdistで行列全体を一括計算する
+    """
+    names = [_match_key(r.get("name")) for r in response_list]
+    pieces = [_match_key(r.get("piece_title")) for r in response_list]
+    program_names = [_match_key(p.get("performer_name")) for p in program_list]
+    program_pieces = [_match_key(p.get("piece_title")) for p in program_list]
+
+    name_scores = rf_process.cdist(names, program_names, scorer=fuzz.token_set_ratio, workers=-1)
+    piece_scores = rf_process.cdist(pieces, program_pieces, scorer=fuzz.partial_ratio, workers=-1)
+    return ((name_scores + piece_scores) / 2).tolist()
+
+
+def _match_obvious_pairs(
+    response_list: List[Dict],
+    program_list: List[Dict],
+    auto_accept: float,
+    auto_reject: float
+) -> Dict[int, Dict]:
+    """
+    文字列類似度で明らかな一致・不一致を確定（Geminiに渡す件数を減らすため）
 
-【アンケート回答】
-{json.dumps(form_responses, ensure_ascii=False, indent=2)}
+    Args:
+        response_list: アンケート回答（正規化済み）
+        program_list: プログラム情報（正規化済み）
+        auto_accept: この類似度以上なら自動で一致とみなす
+        auto_reject: 全プログラムとの類似度がこの値未満なら自動で除外する（0で無効）
+
+    Returns:
+        response_id -> 紐付け情報（Geminiの出力と同じ形式）
+    """
+    scores = _score_matrix(response_list, program_list)
+    decided = {}
+
+    # 類似度の高い組み合わせから確定（1つのプログラムには1つの回答のみ）
+    candidates = sorted(
+        (
+            (score, i, j)
+            for i, row in enumerate(scores)
+            for j, score in enumerate(row)
+            if score >= auto_accept
+        ),
+        key=lambda c: c[0],
+        reverse=True
+    )
+    used_programs = set()
+    for score, i, j in candidates:
+        res_id = response_list[i]["response_id"]
+        if res_id in decided or j in used_programs:
+            continue
+        used_programs.add(j)
+        decided[res_id] = {
+            "response_id": res_id,
+            "mapping_order": program_list[j]["mapping_order"],
+            "confidence_score": round(score, 1),
+            "reason": "氏名・曲名の文字列類似度による自動一致"
+        }
+
+    if auto_reject > 0:
+        for i, row in enumerate(scores):
+            res_id = response_list[i]["response_id"]
+            best = max(row, default=0.0)
+            if res_id not in decided and best < auto_reject:
+                decided[res_id] = {
+                    "response_id": res_id,
+                    "mapping_order": None,
+                    "confidence_score": round(best, 1),
+                    "reason": "文字列類似度が低いため自動で除外"
+                }
+
+    return decided
+
+
+def _split_by_candidates(
+    response_list: List[Dict],
+    program_list: List[Dict],
+    limit: int = PROMPT_CANDIDATES,
+    min_score: float = CANDIDATE_MIN_SCORE
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    各アンケート回答に文字列類似度の上位limit件のプログラムを候補として付与
+
+    Returns:
+        (候補を付与した回答, 最上位の候補でもmin_score未満で候補を絞れない回答)
+    """
+    scores = _score_matrix(response_list, program_list)
+    orders = [p["mapping_order"] for p in program_list]
+    with_candidates = []
+    without_candidates = []
+    for r, row in zip(response_list, scores):
+        # 同点の場合はmapping_order順（プロンプトを入力に対して一意にするため）
+        top = sorted(range(len(orders)), key=lambda j: (-row[j], orders[j]))[:limit]
+        if not top or row[top[0]] < min_score:
+            without_candidates.append(r)
+        else:
+            with_candidates.append({**r, "candidates": [program_list[j] for j in top]})
+    return with_candidates, without_candidates
 
+
+_MAPPING_RULES = """
 【紐付けルール】
 1. 演奏者名 (performer_name vs name):
    - 姓名の順序、スペースの有無、常用漢字と旧字体の違いなどを考慮してください。
@@ -181,51 +294,164 @@ def map_with_form_responses(
 3. 全体最適化:
    - 1つのアンケート回答が複数のプログラムにマッチしそうな場合は、全体のバランスを見て最も自然な組み合わせを決定してください。
    - アンケート回答者がプログラムに存在しない場合は、mapping_order を null にしてください。
+"""
 
+_MAPPING_OUTPUT_FORMAT = """
 【出力形式】
 必ず以下のJSON構造のみを返してください。
 
 ```json
-{{
+{
   "mappings": [
-    {{
+    {
       "response_id": アンケートのID,
       "mapping_order": マッチしたプログラムの mapping_order (数値、見つからない場合は null),
       "confidence_score": 0-100の信頼度,
       "reason": "紐付けた理由（例：氏名が完全一致、曲名が「月光」で共通など）"
-    }}
+    }
   ]
-}}
+}
 ```
 """
 
+
+def _build_mapping_prompt(program_list: List[Dict], response_list: List[Dict]) -> str:
+    """アンケート回答とプログラムを紐付けるためのGeminiプロンプトを生成（全プログラムから選ばせる）"""
+    return f"""
+あなたはピアノコンサートの運営スタッフです。
+「プログラム情報」と「演奏者からのアンケート回答」を照合し、どのアンケート回答がどのプログラム（動画）に対応するかを紐付けてください。
+
+【プログラム情報（動画紐付け済み）】
+{json.dumps(program_list, ensure_ascii=False, indent=2)}
+
+【アンケート回答】
+{json.dumps(response_list, ensure_ascii=False, indent=2)}
+{_MAPPING_RULES}{_MAPPING_OUTPUT_FORMAT}"""
+
+
+def _build_candidate_prompt(response_list: List[Dict]) -> str:
+    """
+    候補を付与したアンケート回答を紐付けるためのGeminiプロンプトを生成
+
+    プログラム全体は渡さず、各回答にはその候補（candidates）だけを添える
+    """
+    return f"""
+あなたはピアノコンサートの運営スタッフです。
+各アンケート回答には、文字列の類似度が高いプログラム（動画）の候補が candidates として付いています。
+回答ごとに、候補の中から対応するプログラムを選んでください。
+
+【アンケート回答と候補プログラム】
+{json.dumps(response_list, ensure_ascii=False, indent=2)}
+{_MAPPING_RULES}4. 候補:
+   - mapping_order は必ずその回答の candidates に含まれるものから選んでください。
+   - 候補の中に該当するものがない場合は、mapping_order を null にしてください。
+{_MAPPING_OUTPUT_FORMAT}"""
+
+
+def map_with_form_responses(
+    program_video_mappings: List[Dict],
+    form_responses: List[Dict],
+    use_gemini: bool = True,
+    use_cache: bool = True,
+    auto_accept: float = AUTO_ACCEPT_SCORE,
+    auto_reject: float = 0.0
+) -> List[Dict]:
+    """
+    プログラム+動画情報とアンケート回答を紐付け（一括AIマッピング対応）
+
+    文字列類似度がauto_accept以上の組み合わせはGeminiを使わずに確定し、
+    残りの曖昧な回答だけをGeminiに問い合わせる。
+    use_cacheがTrueの場合、同一入力に対するGemini応答のキャッシュを再利用する
+    """
+    # プログラムと動画の両方が揃っているものだけを一度だけ抽出して使い回す
+    valid_mappings = _valid_mappings(program_video_mappings)
+
+    if not use_gemini:
+        # Geminiを使わない場合の簡易マッチング（フォールバック）
+        return _map_simple(valid_mappings, form_responses)
+
+    logger.info("\n" + "=" * 60)
+    logger.info("アンケート回答との一括AI紐付けを開始します")
+    logger.info("=" * 60)
+
+    # 有効なプログラム情報のリストを作成
+    program_list = [
+        {
+            "mapping_order": m["mapping_order"],
+            "performer_name": _normalize_text(m.get("performer_name", "")),
+            "piece_title": _normalize_text(m.get("piece_title", "")),
+            "video_name": m.get("video_name", "")
+        }
+        for m in valid_mappings
+    ]
+
+    if not program_list or not form_responses:
+        logger.warning("マッピング対象のデータが不足しています")
+        return []
+
+    # 照合に必要な項目だけを正規化して渡す（取得順や無関係な項目の違いでキャッシュが外れないように）
+    response_list = sorted(
+        (
+            {
+                "response_id": r["response_id"],
+                "name": _normalize_text(r.get("name", "")),
+                "piece_title": _normalize_text(r.get("piece_title", ""))
+            }
+            for r in form_responses
+        ),
+        key=lambda r: r["response_id"]
+    )
+
+    # 明らかな一致・不一致は文字列類似度で確定し、残りだけをGeminiに渡す
+    mapping_dict = _match_obvious_pairs(response_list, program_list, auto_accept, auto_reject)
+    matched_orders = {m["mapping_order"] for m in mapping_dict.values()}
+    remaining_responses = [r for r in response_list if r["response_id"] not in mapping_dict]
+    remaining_programs = [p for p in program_list if p["mapping_order"] not in matched_orders]
+    logger.info(
+        f"文字列類似度で確定: {len(mapping_dict)}件 / Geminiで判定: {len(remaining_responses)}件"
+    )
+
     try:
-        config = ConfigManager().config
-        api_key = config['workflow'].get('gemini_api_key')
-        if not api_key:
-            raise ValueError("Gemini APIキーが設定されていません。")
-        
-        configure_gemini(api_key)
-        model_name = config['workflow'].get('gemini_model', 'gemini-2.5-flash')
-        
-        output = call_gemini_api(prompt, model_name=model_name)
-        result_data = extract_json_from_text(output)
-        
-        mapping_dict = {m["response_id"]: m for m in result_data.get("mappings", [])}
-        
-        # 紐付け結果の整理
-        # アンケート回答があったものだけを抽出する方針
-        mapping_dict = {m["response_id"]: m for m in result_data.get("mappings", [])}
+        if remaining_responses and remaining_programs:
+            model_name = configure_gemini_from_config()
+
+            def ask_gemini(prompt: str):
+                output = call_gemini_api(prompt, model_name=model_name, use_cache=use_cache,
+                                         validate=_check_mapping_output)
+                # 紐付け結果の整理
+                # アンケート回答があったものだけを抽出する方針
+                for m in extract_json_from_text(output).get("mappings", []):
+                    mapping_dict.setdefault(m["response_id"], m)
+
+            if len(remaining_programs) <= PROMPT_CANDIDATES:
+                # 候補を絞る意味がないため、全プログラムを渡す
+                ask_gemini(_build_mapping_prompt(remaining_programs, remaining_responses))
+            else:
+                # 各回答には上位候補だけを渡し、候補を絞れない回答だけ全プログラムで判定する
+                with_candidates, without_candidates = _split_by_candidates(
+                    remaining_responses, remaining_programs
+                )
+                if with_candidates:
+                    ask_gemini(_build_candidate_prompt(with_candidates))
+                if without_candidates:
+                    matched_orders = {m["mapping_order"] for m in mapping_dict.values()}
+                    fallback_programs = [p for p in remaining_programs
+                                         if p["mapping_order"] not in matched_orders]
+                    logger.info(f"候補を絞れない回答: {len(without_candidates)}件（全プログラムから判定）")
+                    if fallback_programs:
+                        ask_gemini(_build_mapping_prompt(fallback_programs, without_candidates))
         
         final_mappings = []
+        log_info = logger.isEnabledFor(logging.INFO)
+        # mapping_order から元のマッピング情報を引くための索引
+        by_order = {m["mapping_order"]: m for m in program_video_mappings}
         for form_resp in form_responses:
             res_id = form_resp["response_id"]
             m_info = mapping_dict.get(res_id)
             
             if m_info and m_info["mapping_order"] is not None:
                 target_order = m_info["mapping_order"]
-                # mapping_order から元のマッピング情報を探す
-                best_match = next((m for m in program_video_mappings if m["mapping_order"] == target_order), None)
+                best_match = by_order.get(target_order)
                 
                 if best_match:
                     final_mapping = {
@@ -236,7 +462,8 @@ def map_with_form_responses(
                         "matched": True
                     }
                     final_mappings.append(final_mapping)
-                    logger.info(f"✓ アンケート {res_id} -> プログラム {target_order} (信頼度: {m_info['confidence_score']}%)")
+                    if log_info:
+                        logger.info(f"✓ アンケート {res_id} -> プログラム {target_order} (信頼度: {m_info['confidence_score']}%)")
                 else:
                     logger.warning(f"？ アンケート {res_id} が指定したプログラム番号 {target_order} が見つかりません")
             else:
@@ -246,37 +473,62 @@ def map_with_form_responses(
 
     except Exception as e:
         logger.error(f"一括マッピングエラー: {e}")
-        return _map_simple(program_video_mappings, form_responses)
+        return _map_simple(valid_mappings, form_responses)
+
+# Geminiの紐付け結果の各要素に必要なキー
+_MAPPING_RESULT_KEYS = frozenset({"response_id", "mapping_order", "confidence_score", "reason"})
+
+def _check_mapping_output(output: str):
+    """Geminiの紐付け結果が想定どおりの形式か検証する（無効ならValueError。キャッシュ可否の判定に使用）"""
+    mappings = extract_json_from_text(output).get("mappings")
+    if not isinstance(mappings, list):
+        raise ValueError("'mappings'がリストではありません")
+    for m in mappings:
+        if not isinstance(m, dict) or not _MAPPING_RESULT_KEYS.issubset(m):
+            raise ValueError(f"紐付け結果の形式が不正です: {m}")
+
+def _valid_mappings(program_video_mappings: List[Dict]) -> List[Dict]:
+    """プログラム情報と動画の両方が揃っている紐付けだけを返す"""
+    return [
+        m for m in program_video_mappings
+        if m.get("program_data") and m.get("video_data")
+    ]
 
-def _map_simple(program_video_mappings, form_responses):
+def _map_simple(program_video_mappings, form_responses, score_cutoff: float = SIMPLE_MATCH_CUTOFF):
     """
-    簡易的な文字列一致によるマッピング（フォールバック用）
+    文字列類似度によるマッピング（フォールバック用）
+
+    回答ごとに氏名と曲名の類似度が最も高いプログラムを選び、score_cutoff未満は除外する
     """
+    valid_mappings = _valid_mappings(program_video_mappings)
+    if not valid_mappings or not form_responses:
+        return []
+
+    scores = _score_matrix(form_responses, valid_mappings)
+
     final_mappings = []
-    for form_resp in form_responses:
-        form_name = form_resp.get("name", "")
-        form_piece = form_resp.get("piece_title", "")
-        
-        for mapping in program_video_mappings:
-            if not mapping.get("program_data") or not mapping.get("video_data"):
-                continue
-            
-            p_name = mapping.get("performer_name", "")
-            p_piece = mapping.get("piece_title", "")
-            
-            if (form_name in p_name or p_name in form_name) and \
-               (form_piece[:5] in p_piece or p_piece[:5] in form_piece):
-                final_mappings.append({
-                    **mapping,
-                    "form_response": form_resp,
-                    "confidence_score": 70.0,
-                    "match_reason": "簡易一致",
-                    "matched": True
-                })
-                break
+    for form_resp, row in zip(form_responses, scores):
+        best = max(range(len(row)), key=row.__getitem__)
+        if row[best] < score_cutoff:
+            continue
+        final_mappings.append({
+            **valid_mappings[best],
+            "form_response": form_resp,
+            "confidence_score": round(row[best], 1),
+            "match_reason": "簡易一致",
+            "matched": True
+        })
     return final_mappings
 
 
+def _utf8_truncate(text: str, max_bytes: int) -> str:
+    """UTF-8でmax_bytesバイト以内に収まるよう文字の途中で切らずに切り詰める"""
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return text
+    return encoded[:max_bytes].decode('utf-8', errors='ignore')
+
+
 def generate_upload_metadata(mappings: List[Dict], concert_info: Optional[Dict] = None) -> Dict:
     """
     YouTubeアップロード用のメタデータを生成
@@ -289,10 +541,13 @@ def generate_upload_metadata(mappings: List[Dict], concert_info: Optional[Dict]
         upload_metadata.json形式のデータ
     """
     videos = []
+    log_info = logger.isEnabledFor(logging.INFO)
 
     for mapping in mappings:
-        form_resp = mapping.get("form_response", {})
-        program_data = mapping.get("program_data", {})
+        # 各項目は先に一度だけ取り出して使い回す（値がNoneの場合も空の辞書として扱う）
+        form_resp = mapping.get("form_response") or {}
+        program_data = mapping.get("program_data") or {}
+        composer = program_data.get("piece_composer", "")
 
         # 演奏者名
         performer_name = program_data.get("performer_name", "")
@@ -306,39 +561,27 @@ def generate_upload_metadata(mappings: List[Dict], concert_info: Optional[Dict]
         else:
             title = piece_title
 
-        # 説明文
-        description_parts = []
-
-        if concert_info:
-            description_parts.append(f"{concert_info.get('title', 'コンサート')}での演奏\n")
-
-        if performer_name:
-            description_parts.append(f"演奏者: {performer_name}")
-
-        description_parts.append(f"曲名: {piece_title}")
-
-        if program_data.get("piece_composer"):
-            description_parts.append(f"作曲: {program_data['piece_composer']}")
-
-        # アンケートの追加説明文
-        extra_desc = form_resp.get("description_extra", "")
-        if extra_desc:
-            description_parts.append(f"\n{extra_desc}")
-
-        description_parts.append("\n※この動画は自動編集ソフトウェアにより処理されています")
-
-        description = "\n".join(description_parts)
+        # 説明文（該当しない項目はNoneとして除外）
+        extra_desc = form_resp.get("description_extra", "")  # アンケートの追加説明文
+        description_parts = (
+            f"{concert_info.get('title', 'コンサート')}での演奏\n" if concert_info else None,
+            f"演奏者: {performer_name}" if performer_name else None,
+            f"曲名: {piece_title}",
+            f"作曲: {composer}" if composer else None,
+            f"\n{extra_desc}" if extra_desc else None,
+            "\n※この動画は自動編集ソフトウェアにより処理されています",
+        )
+        description = "\n".join(part for part in description_parts if part)
 
         # タグ
         tags = ["ピアノ", "クラシック", "コンサート"]
-        composer = program_data.get("piece_composer", "")
         if composer:
             tags.append(composer)
 
         # メタデータ
         video_metadata = {
             "title": title[:100],  # 最大100文字
-            "description": description[:5000],  # 最大5000バイト
+            "description": _utf8_truncate(description, 5000),  # 最大5000バイト（UTF-8）
             "tags": tags,
             "privacy_status": form_resp.get("privacy", "unlisted"),
             "playlist_id": "",
@@ -347,7 +590,8 @@ def generate_upload_metadata(mappings: List[Dict], concert_info: Optional[Dict]
 
         videos.append(video_metadata)
 
-        logger.info(f"メタデータ生成: {title}")
+        if log_info:
+            logger.info(f"メタデータ生成: {title}")
 
     upload_metadata = {
         "videos": videos
@@ -392,6 +636,28 @@ def main():
         action="store_true",
         help="Gemini CLIを使用せず、簡易マッチングを使用"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Gemini応答のキャッシュを使用しない"
+    )
+    parser.add_argument(
+        "--auto-accept",
+        type=float,
+        default=AUTO_ACCEPT_SCORE,
+        help=f"この類似度（0-100）以上の組み合わせはGeminiを使わずに一致とみなす（デフォルト: {AUTO_ACCEPT_SCORE:g}）"
+    )
+    parser.add_argument(
+        "--auto-reject",
+        type=float,
+        default=0.0,
+        help="全プログラムとの類似度がこの値未満の回答はGeminiを使わずに除外（デフォルト: 0 = 無効）"
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="実行前にGemini応答のキャッシュを削除"
+    )
     parser.add_argument(
         "--mapping-output",
         type=Path,
@@ -401,19 +667,20 @@ def main():
 
     args = parser.parse_args()
 
+    if args.clear_cache:
+        clear_gemini_cache()
+
     try:
         # 1. データ読み込み
         logger.info("=" * 60)
         logger.info("データ読み込み")
         logger.info("=" * 60)
 
-        with open(args.program_json, 'r', encoding='utf-8') as f:
-            program_data = json.load(f)
+        program_data = load_json(args.program_json)
         logger.info(f"✓ PDFプログラム情報: {args.program_json}")
 
-        with open(args.form_json, 'r', encoding='utf-8') as f:
-            form_data = json.load(f)
-            form_responses = form_data.get("responses", [])
+        form_data = load_json(args.form_json)
+        form_responses = form_data.get("responses", [])
         logger.info(f"✓ アンケート回答: {args.form_json} ({len(form_responses)}件)")
 
         # 2. 動画ファイル取得
@@ -427,7 +694,10 @@ def main():
         final_mappings = map_with_form_responses(
             program_video_mappings,
             form_responses,
-            use_gemini=use_gemini
+            use_gemini=use_gemini,
+            use_cache=not args.no_cache,
+            auto_accept=args.auto_accept,
+            auto_reject=args.auto_reject
         )
 
         # 5. アップロードメタデータ生成
@@ -439,19 +709,17 @@ def main():
         upload_metadata = generate_upload_metadata(final_mappings, concert_info)
 
         # 6. 保存
-        with open(args.output, 'w', encoding='utf-8') as f:
-            json.dump(upload_metadata, f, ensure_ascii=False, indent=2)
+        save_json(upload_metadata, args.output)
         logger.info(f"\n✓ アップロードメタデータを保存: {args.output}")
 
-        # マッピング詳細も保存
+        # マッピング詳細も保存（各マッピングに元データを丸ごと含み大きくなるため整形せずに出力）
         mapping_result = {
             "mapping_time": datetime.now().isoformat(),
             "total_mappings": len(final_mappings),
             "use_gemini": use_gemini,
             "mappings": final_mappings
         }
-        with open(args.mapping_output, 'w', encoding='utf-8') as f:
-            json.dump(mapping_result, f, ensure_ascii=False, indent=2)
+        save_json(mapping_result, args.mapping_output, indent=False)
         logger.info(f"✓ マッピング詳細を保存: {args.mapping_output}")
 
         # 結果サマリー
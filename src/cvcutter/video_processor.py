@@ -1,43 +1,43 @@
 import os
-import re
 import subprocess
 import shutil
+import tempfile
 import imageio_ffmpeg
 import numpy as np
 from pathlib import Path
-try:
-    from moviepy.editor import VideoFileClip, AudioFileClip
-except ImportError:
-    from moviepy import VideoFileClip, AudioFileClip
 from .detect_performances import detect_performances_by_motion
-from .sync_audio import find_audio_offset
+from .sync_audio import DECIMATE_FACTOR, AudioSyncer
 from tqdm import tqdm
 import time
-from .video_utils import concatenate_videos, get_gpu_args
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .video_utils import concatenate_videos, decode_audio, get_gpu_args, get_keyframe_times, snap_to_keyframe
+
+# Every output in one ffmpeg process holds its own encoder session, and consumer
+# NVIDIA cards cap concurrent NVENC sessions, so segments are encoded in batches.
+MAX_OUTPUTS_PER_FFMPEG = 3
+
+# Input options that decode with NVDEC and keep the frames in CUDA memory
+CUDA_DECODE_ARGS = ['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda']
 
 # --- Core Logic Functions (from previous version) ---
 
 def get_consensus_offset(offsets, tolerance=1.0):
     if not offsets: return None
-    sorted_offsets = sorted(offsets)
-    best_cluster = []
-    for i in range(len(sorted_offsets)):
-        current_offset = sorted_offsets[i]
-        current_cluster = [o for o in sorted_offsets if abs(o - current_offset) <= tolerance]
-        if len(current_cluster) > len(best_cluster):
-            best_cluster = current_cluster
-    if not best_cluster: return np.median(sorted_offsets)
-    return np.mean(best_cluster)
+    sorted_offsets = np.sort(np.asarray(offsets, dtype=np.float64))
+    # within[i, j]: offset j lies within tolerance of offset i (each row is one candidate cluster)
+    within = np.abs(sorted_offsets[:, None] - sorted_offsets[None, :]) <= tolerance
+    # argmax returns the first largest cluster, matching the previous loop's tie-break
+    best = within.sum(axis=1).argmax()
+    return np.mean(sorted_offsets[within[best]])
 
 def run_ffmpeg_with_progress(command, duration, progress_callback=None):
     """
     Executes FFMPEG with progress monitoring.
     progress_callback: function(current_time, total_duration, message)
     """
-    ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
-    if command[0] == 'ffmpeg':
-        command[0] = ffmpeg_path
-        
+    executable = imageio_ffmpeg.get_ffmpeg_exe() if command[0] == 'ffmpeg' else command[0]
+
     # Hide console window on Windows
     startupinfo = None
     if os.name == 'nt':
@@ -45,37 +45,112 @@ def run_ffmpeg_with_progress(command, duration, progress_callback=None):
         startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
         startupinfo.wShowWindow = subprocess.SW_HIDE
 
-    process = subprocess.Popen(
-        command,
-        stderr=subprocess.PIPE,
-        universal_newlines=True,
-        encoding='utf-8',
-        startupinfo=startupinfo
-    )
-    time_regex = re.compile(r"time=(\d{2}):(\d{2}):(\d{2})\.(\d{2})")
-
-    # We still use tqdm for CLI output but also call the callback for GUI
-    with tqdm(total=duration, unit='s', desc="    Encoding", ncols=80) as pbar:
-        last_time = 0
-        for line in process.stderr:
-            match = time_regex.search(line)
-            if match:
-                hours, minutes, seconds, ms = map(int, match.groups())
-                current_time = hours * 3600 + minutes * 60 + seconds + ms / 100
-                update_amount = current_time - last_time
-                pbar.update(update_amount)
+    # Machine-readable progress (key=value lines, including out_time_us) on stdout;
+    # stderr is only needed when the run fails, so it is spooled to a temporary file.
+    # A new list is built so the caller's command is left untouched (e.g. for retries).
+    cmd = [executable, '-progress', 'pipe:1', '-nostats', *command[1:]]
+
+    with tempfile.TemporaryFile() as err_file:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=err_file,
+            universal_newlines=True,
+            encoding='utf-8',
+            startupinfo=startupinfo
+        )
+
+        # We still use tqdm for CLI output but also call the callback for GUI
+        with tqdm(total=duration, unit='s', desc="    Encoding", ncols=80) as pbar:
+            last_time = 0
+            for line in process.stdout:
+                if not line.startswith('out_time_us='):
+                    continue
+                value = line[12:].strip()
+                if not value.isdigit():
+                    continue  # "N/A" before the first frame is written
+                current_time = int(value) / 1_000_000
+                pbar.update(current_time - last_time)
 
                 if progress_callback:
                     progress_callback(current_time, duration, f"Encoding: {pbar.n:.2f} / {pbar.total:.2f} s")
 
                 last_time = current_time
 
-    process.wait()
-    if process.returncode != 0:
-        print(f"  ERROR: FFMPEG process failed with code {process.returncode}")
-        return False
+        process.wait()
+        if process.returncode != 0:
+            err_file.seek(0)
+            stderr_tail = err_file.read().decode('utf-8', errors='replace')[-2000:]
+            print(f"  ERROR: FFMPEG process failed with code {process.returncode}\n{stderr_tail}")
+            return False
     return True
 
+def default_encode_workers(vcodec_args):
+    """
+    How many ffmpeg processes to run at once when 'encode_workers' is not set.
+    NVENC batches already hold MAX_OUTPUTS_PER_FFMPEG encoder sessions each, so they run
+    one at a time; libx264 is multithreaded itself, so only large CPUs get a second process.
+    """
+    if 'h264_nvenc' in vcodec_args:
+        return 1
+    return max(1, min(4, (os.cpu_count() or 1) // 8))
+
+def _segment_ffmpeg_args(segment, input_index, output_index, config, vcodec_args, hw_decode=False):
+    """
+    Build the ffmpeg arguments for one segment inside a (possibly multi-output) command.
+    With hw_decode, the video is decoded by NVDEC and deinterlaced with yadif_cuda so
+    frames stay in GPU memory all the way to NVENC.
+    Returns (input_args, filter_chains, output_args, number_of_inputs_used).
+    """
+    v = input_index
+    copy_video = segment.get('copy_video', False)
+    hw_decode = hw_decode and not copy_video
+    input_args = (CUDA_DECODE_ARGS if hw_decode else []) + \
+                 ['-ss', str(segment['start']), '-i', config['video_path']]
+    filter_chains = []
+    if segment['mic_start'] is not None:
+        m = input_index + 1
+        input_args += ['-ss', str(segment['mic_start']), '-i', config['mic_audio_path']]
+        filter_chains.append(
+            f"[{v}:a]volume={config['video_audio_volume']}[a0_{output_index}];"
+            f"[{m}:a]volume={config['mic_audio_volume']}[a1_{output_index}];"
+            f"[a0_{output_index}][a1_{output_index}]amix=inputs=2[aout_{output_index}]"
+        )
+        audio_map = f"[aout_{output_index}]"
+    else:
+        # Video audio only
+        audio_map = f"{v}:a"
+
+    if copy_video:
+        # Keyframe-aligned start: the video stream is copied as-is (no deinterlace)
+        video_args = ['-c:v', 'copy']
+    else:
+        video_args = ['-vf', 'yadif_cuda' if hw_decode else 'yadif'] + vcodec_args
+    output_args = ['-t', str(segment['duration']), '-map', f"{v}:v", '-map', audio_map] + \
+                  video_args + ['-c:a', 'aac', '-b:a', '192k', segment['output']]
+    return input_args, filter_chains, output_args, (1 if segment['mic_start'] is None else 2)
+
+def build_segments_command(segments, config, vcodec_args, hw_decode=False):
+    """
+    Build a single ffmpeg command that encodes every segment in `segments`.
+    Each segment gets its own input-seeked inputs, so the gaps between performances
+    are never decoded, and its own output file.
+    """
+    input_args, filter_chains, output_args = [], [], []
+    next_input = 0
+    for k, segment in enumerate(segments):
+        seg_inputs, seg_filters, seg_outputs, used = _segment_ffmpeg_args(
+            segment, next_input, k, config, vcodec_args, hw_decode)
+        input_args += seg_inputs
+        filter_chains += seg_filters
+        output_args += seg_outputs
+        next_input += used
+
+    command = ['ffmpeg', '-y'] + input_args
+    if filter_chains:
+        command += ['-filter_complex', ";".join(filter_chains)]
+    return command + output_args
+
 def process_pair(video_paths, audio_path, config_overrides, progress_callback=None):
     """
     Main processing logic for a single video/audio pair.
@@ -129,9 +204,12 @@ def process_pair(video_paths, audio_path, config_overrides, progress_callback=No
         'mic_audio_volume': 1.5,
         'audio_sync_sample_rate': 22050,
         'use_gpu': True,
+        'encode_workers': None,  # parallel ffmpeg processes; None = choose from the encoder
+        'keyframe_copy_tolerance': None,  # seconds; e.g. 1.0 to stream-copy keyframe-aligned segments
         'detection_config': { 'max_seconds_to_process': None, 'min_duration_seconds': 30, 'show_video': False,
                               'mog2_threshold': 40, 'min_contour_area': 3000, 'left_zone_end_percent': 0.15,
-                              'center_zone_end_percent': 0.65 } # 誤検知減少のためここを変更すべし
+                              'center_zone_end_percent': 0.65,
+                              'frame_stride': 1, 'detection_width': None } # 誤検知減少のためここを変更すべし。frame_stride>1で解析を間引き、detection_width(例: 640)で縮小して高速化
     }
     config.update(config_overrides)
 
@@ -152,14 +230,29 @@ def process_pair(video_paths, audio_path, config_overrides, progress_callback=No
         update_status(f"Syncing audio for {os.path.basename(video_path)}...")
         all_offsets = []
 
-        # We need to handle MoviePy not blocking the UI if possible, but here it runs in the thread
-        with VideoFileClip(config['video_path']) as video:
+        # Decode both audio tracks once at the decimated rate used by the coarse search;
+        # each segment's needle is then just a slice. Full-rate audio is only decoded for
+        # the short windows the fine search needs, so a long concert is never held at sr.
+        sr = config['audio_sync_sample_rate']
+        ds_rate = sr // DECIMATE_FACTOR
+        try:
+            video_audio = decode_audio(config['video_path'], ds_rate)
+            mic_audio = decode_audio(config['mic_audio_path'], ds_rate)
+        except RuntimeError as e:
+            print(e)
+            video_audio = mic_audio = None
+
+        def window_reader(path, offset=0.0):
+            """Return a (start, end) sample -> full-rate audio reader for path, starting at offset seconds."""
+            return lambda start, end: decode_audio(path, sr, offset + start / sr, (end - start) / sr)
+
+        if video_audio is not None:
+            # The mic track is normalised and transformed once for all segments
+            syncer = AudioSyncer.from_decimated(mic_audio, ds_rate, sr, window_reader(config['mic_audio_path']))
             for i, (start, end) in enumerate(performance_segments):
-                needle_path = os.path.join(config['temp_dir'], f'needle_{i+1}.wav')
-                # Extract audio for sync
-                video.audio.subclip(start, end).write_audiofile(needle_path, fps=config['audio_sync_sample_rate'], logger=None)
+                needle = video_audio[int(start * ds_rate):int(end * ds_rate)]
 
-                sync_result = find_audio_offset(config['mic_audio_path'], needle_path, config['audio_sync_sample_rate'])
+                sync_result = syncer.find_decimated(needle, window_reader(config['video_path'], start))
                 if sync_result:
                     all_offsets.append(sync_result['offset_seconds'] - start)
 
@@ -175,41 +268,107 @@ def process_pair(video_paths, audio_path, config_overrides, progress_callback=No
             print(f"\nFinal consensus global time offset: {global_offset:.4f} seconds")
 
     # --- Step 3: Process with FFMPEG ---
-    for i, (start_time, end_time) in enumerate(performance_segments):
-        duration = end_time - start_time
-        base_name = os.path.splitext(os.path.basename(base_name_source_path))[0]
-        output_filename = os.path.join(config['output_dir'], f"{base_name}_performance_{i+1}.mp4")
+    # Check for GPU acceleration (same encoder for every segment)
+    gpu_args = get_gpu_args() if config.get('use_gpu') else ['-c:v', 'libx264', '-preset', 'medium']
+    vcodec_args = gpu_args[gpu_args.index('-c:v'):]
+    # Keep decoding and deinterlacing on the GPU when encoding with NVENC
+    hw_decode = 'h264_nvenc' in vcodec_args
 
-        update_status(f"Encoding segment {i+1} of {os.path.basename(video_path)}...")
+    # Optional fast path: when a segment starts within this many seconds after a keyframe,
+    # start at that keyframe and copy the video stream instead of re-encoding it.
+    copy_tolerance = config.get('keyframe_copy_tolerance')
+    keyframes = []
+    if copy_tolerance:
+        update_status(f"Reading keyframes of {os.path.basename(video_path)}...")
+        keyframes = get_keyframe_times(config['video_path'])
 
-        # Base command with input video
-        command = ['ffmpeg', '-y']
-        
-        # Check for GPU acceleration
-        gpu_args = get_gpu_args() if config.get('use_gpu') else ['-c:v', 'libx264', '-preset', 'medium']
-        vcodec_idx = gpu_args.index('-c:v') + 1
-        vcodec = gpu_args[vcodec_idx]
-        extra_args = gpu_args[vcodec_idx+1:]
+    base_name = os.path.splitext(os.path.basename(base_name_source_path))[0]
+    segments = []
+    for i, (start_time, end_time) in enumerate(performance_segments):
+        copy_video = False
+        keyframe = snap_to_keyframe(keyframes, start_time) if keyframes else None
+        if keyframe is not None and start_time - keyframe <= copy_tolerance:
+            start_time, copy_video = keyframe, True
 
+        mic_start = None
         if config['mic_audio_path']:
             mic_start = start_time + global_offset
             if mic_start < 0:
                 print(f"Warning: Mic start time {mic_start} is negative for segment {i+1}. Skipping sync for this segment.")
-                # Fallback for this segment
-                command += ['-ss', str(start_time), '-i', config['video_path'], '-t', str(duration),
-                            '-map', '0:v', '-map', '0:a', '-vf', 'yadif', '-c:v', vcodec] + extra_args + \
-                           ['-c:a', 'aac', '-b:a', '192k', output_filename]
-            else:
-                command += ['-ss', str(start_time), '-i', config['video_path'],
-                            '-ss', str(mic_start), '-i', config['mic_audio_path'],
-                            '-t', str(duration), '-filter_complex',
-                            f"[0:a]volume={config['video_audio_volume']}[a0];[1:a]volume={config['mic_audio_volume']}[a1];[a0][a1]amix=inputs=2[aout]",
-                            '-map', '0:v', '-map', '[aout]', '-vf', 'yadif', '-c:v', vcodec] + extra_args + \
-                           ['-c:a', 'aac', '-b:a', '192k', output_filename]
-        else:
-            # Video audio only
-            command += ['-ss', str(start_time), '-i', config['video_path'], '-t', str(duration),
-                        '-map', '0:v', '-map', '0:a', '-vf', 'yadif', '-c:v', vcodec] + extra_args + \
-                       ['-c:a', 'aac', '-b:a', '192k', output_filename]
+                mic_start = None
+        segments.append({
+            'number': i + 1,
+            'start': start_time,
+            'duration': end_time - start_time,
+            'mic_start': mic_start,
+            'copy_video': copy_video,
+            'output': os.path.join(config['output_dir'], f"{base_name}_performance_{i+1}.mp4"),
+        })
+
+    # Encode several segments per ffmpeg process to share process start-up and
+    # encoder initialisation; batches stay small enough for NVENC session limits.
+    batches = [segments[b:b + MAX_OUTPUTS_PER_FFMPEG] for b in range(0, len(segments), MAX_OUTPUTS_PER_FFMPEG)]
+    # All outputs in a batch are encoded side by side, so a batch takes as long as its longest segment
+    batch_durations = [max(seg['duration'] for seg in batch) for batch in batches]
+    total_duration = sum(batch_durations)
+    batch_progress = [0.0] * len(batches)
+    progress_lock = threading.Lock()
+
+    def batch_callback(index):
+        """Report the combined progress of all batches through progress_callback."""
+        def callback(current_time, duration, message):
+            with progress_lock:
+                batch_progress[index] = min(current_time, duration)
+                done = sum(batch_progress)
+            if progress_callback:
+                progress_callback(done, total_duration, f"Encoding: {done:.2f} / {total_duration:.2f} s")
+        return callback
+
+    # Batches run on worker threads; the NVDEC fallback decision is shared between them
+    decode_lock = threading.Lock()
 
-        run_ffmpeg_with_progress(command, duration, progress_callback)
+    def encode_batch(index):
+        nonlocal hw_decode
+        batch = batches[index]
+        first, last = batch[0]['number'], batch[-1]['number']
+        label = f"segment {first}" if first == last else f"segments {first}-{last}"
+        update_status(f"Encoding {label} of {os.path.basename(video_path)}...")
+
+        callback = batch_callback(index)
+        with decode_lock:
+            use_hw_decode = hw_decode
+        command = build_segments_command(batch, config, vcodec_args, use_hw_decode)
+        if run_ffmpeg_with_progress(command, batch_durations[index], callback):
+            return
+        if use_hw_decode:
+            # The source codec/pixel format may not be supported by NVDEC or the
+            # bundled ffmpeg may lack CUDA filters; use CPU decode from now on.
+            print("GPU decoding failed. Falling back to CPU decoding and deinterlacing...")
+            with decode_lock:
+                hw_decode = False
+            command = build_segments_command(batch, config, vcodec_args)
+            if run_ffmpeg_with_progress(command, batch_durations[index], callback):
+                return
+        if len(batch) > 1:
+            print(f"Batch encode of {label} failed. Retrying one segment at a time...")
+            for seg in batch:
+                update_status(f"Encoding segment {seg['number']} of {os.path.basename(video_path)}...")
+                run_ffmpeg_with_progress(build_segments_command([seg], config, vcodec_args),
+                                         seg['duration'], callback)
+
+    # Independent ffmpeg processes can run side by side; each one is a subprocess,
+    # so threads are enough to drive them.
+    workers = min(config.get('encode_workers') or default_encode_workers(vcodec_args), len(batches))
+    if workers <= 1:
+        for index in range(len(batches)):
+            encode_batch(index)
+    else:
+        first = 0
+        if hw_decode:
+            # Probe NVDEC on the first batch alone, so the other batches do not all
+            # start with CUDA decode before a failure can switch it off.
+            encode_batch(0)
+            first = 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(encode_batch, index) for index in range(first, len(batches))]:
+                future.result()
@@ -1,30 +1,89 @@
+import bisect
+import functools
+import re
 import subprocess
 import os
-import sys
 import tempfile
 import shutil
 import imageio_ffmpeg
-from pathlib import Path
-from typing import List
+import numpy as np
+from typing import List, Optional, Tuple
 
-def get_app_data_path(filename: str) -> Path:
+# Re-exported so existing "from .video_utils import get_app_data_path" imports keep working
+from .config_manager import get_app_data_path
+
+def _run_capturing_stderr(command: List[str], startupinfo=None) -> Tuple[int, str]:
     """
-    EXE実行時と開発環境の両方で、永続化すべきデータファイルの正しいパスを返す
+    Run a command with stderr redirected to a temporary file instead of a pipe.
+    FFmpeg can write a lot of stderr; spooling it to a file avoids draining a pipe
+    on the calling thread, and the text is only decoded when the command fails.
+    Returns (returncode, stderr_text).
     """
-    if getattr(sys, 'frozen', False):
-        # EXE本体があるディレクトリ
-        base_path = Path(sys.executable).parent
-    else:
-        # プロジェクトルート
-        base_path = Path(__file__).parent.parent.parent
-    
-    return base_path / filename
+    with tempfile.TemporaryFile() as err_file:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=err_file, startupinfo=startupinfo)
+        if result.returncode == 0:
+            return result.returncode, ""
+        err_file.seek(0)
+        return result.returncode, err_file.read().decode('utf-8', errors='replace')
+
+_STREAM_LINE_RE = re.compile(r"Stream #\d+:\d+\S*: (Video|Audio): (.*)")
+
+def _split_stream_fields(description: str) -> List[str]:
+    """Split an ffmpeg stream description on commas that are not inside parentheses."""
+    fields, depth, current = [], 0, []
+    for ch in description:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth = max(0, depth - 1)
+        if ch == ',' and depth == 0:
+            fields.append(''.join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    fields.append(''.join(current).strip())
+    return fields
+
+def _stream_signature(path: str) -> Tuple:
+    """
+    Describe the video/audio streams of a file as a comparable tuple, using the
+    header that 'ffmpeg -i' prints (no ffprobe is bundled). Bitrates are left out
+    since they vary between otherwise identical files.
+    """
+    command = [imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-i', str(path)]
+    # ffmpeg exits non-zero because no output is given; the header is still printed
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            startupinfo=_hidden_window_startupinfo())
+    stderr = result.stderr.decode('utf-8', errors='replace')
+
+    signature = []
+    for kind, description in _STREAM_LINE_RE.findall(stderr):
+        fields = _split_stream_fields(description)
+        codec = fields[0].split()[0]
+        if kind == 'Video':
+            # codec, pixel format/field order, resolution, frame rate
+            params = [f for f in fields[1:] if 'x' in f.split(' ')[0] or f.endswith('fps')]
+            signature.append((kind, codec, fields[1] if len(fields) > 1 else '', *params))
+        else:
+            # codec, sample rate, channel layout, sample format
+            signature.append((kind, codec, *fields[1:4]))
+    return tuple(signature)
+
+def _streams_compatible(video_paths: List[str]) -> bool:
+    """True if every input has the same stream layout and parameters (safe for stream copy)."""
+    try:
+        signatures = {_stream_signature(path) for path in video_paths}
+    except OSError as e:
+        print(f"Could not inspect input streams: {e}")
+        return False
+    return len(signatures) == 1 and bool(next(iter(signatures)))
 
 def concatenate_videos(video_paths: List[str], output_path: str) -> bool:
     """
-    Concatenate multiple video files using FFmpeg's concat filter.
-    This method re-encodes the video and audio streams, resetting timestamps
-    to ensure a continuous timeline, which is crucial for subsequent processing.
+    Concatenate multiple video files.
+    Inputs with identical stream parameters are joined by stream copy (concat demuxer).
+    Otherwise FFmpeg's concat filter re-encodes the video and audio streams, resetting
+    timestamps to ensure a continuous timeline, which is crucial for subsequent processing.
     """
     if not video_paths:
         return False
@@ -33,6 +92,15 @@ def concatenate_videos(video_paths: List[str], output_path: str) -> bool:
         shutil.copy2(video_paths[0], output_path)
         return True
 
+    # Files split by the camera share identical stream parameters; those can be
+    # joined by stream copy, which is far faster than re-encoding.
+    if _streams_compatible(video_paths):
+        print("Inputs share the same stream parameters. Trying concat demuxer (stream copy)...")
+        if _concatenate_with_demuxer(video_paths, output_path):
+            print("Concatenation successful.")
+            return True
+        print("Stream copy failed. Re-encoding with concat filter...")
+
     ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
     
     # Build the input part of the command: -i file1 -i file2 ...
@@ -58,16 +126,10 @@ def concatenate_videos(video_paths: List[str], output_path: str) -> bool:
         print(" ".join(command)) # For debugging
 
         # Using STARTUPINFO to hide the console window on Windows
-        startupinfo = None
-        if os.name == 'nt':
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-        result = subprocess.run(command, capture_output=True, text=True, startupinfo=startupinfo)
+        returncode, stderr = _run_capturing_stderr(command, startupinfo=_hidden_window_startupinfo())
         
-        if result.returncode != 0:
-            print(f"Concatenation with filter failed. Error:\n{result.stderr}")
+        if returncode != 0:
+            print(f"Concatenation with filter failed. Error:\n{stderr}")
             # Fallback to demuxer method if filter fails, as it's more robust for identical codecs
             print("Falling back to concat demuxer (stream copy)...")
             return _concatenate_with_demuxer(video_paths, output_path)
@@ -79,32 +141,106 @@ def concatenate_videos(video_paths: List[str], output_path: str) -> bool:
         return False
 
 def _concatenate_with_demuxer(video_paths: List[str], output_path: str) -> bool:
-    """Fallback to the faster but potentially problematic concat demuxer."""
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as f:
-        for path in video_paths:
-            abs_path = os.path.abspath(path).replace("'", "'\\''")
-            f.write(f"file '{abs_path}'\n")
-        list_file = f.name
-    
+    """Join inputs with the concat demuxer (stream copy): fast, but needs matching streams."""
+    # Paths in the list are resolved relative to the list file (in the temp dir), so they
+    # must be absolute, and single quotes must be escaped for the concat syntax.
+    listing = "".join(
+        "file '{}'\n".format(os.path.abspath(path).replace("'", "'\\''")) for path in video_paths
+    )
+    fd, list_file = tempfile.mkstemp(suffix='.txt')
+    try:
+        os.write(fd, listing.encode('utf-8'))
+    finally:
+        os.close(fd)
+
     ffmpeg_path = imageio_ffmpeg.get_ffmpeg_exe()
     try:
         command = [
             ffmpeg_path, '-y', '-f', 'concat', '-safe', '0', '-i', list_file,
             '-c', 'copy', output_path
         ]
-        result = subprocess.run(command, capture_output=True, text=True)
-        if result.returncode != 0:
-            print(f"Fallback concatenation failed: {result.stderr}")
+        returncode, stderr = _run_capturing_stderr(command, startupinfo=_hidden_window_startupinfo())
+        if returncode != 0:
+            print(f"Concat demuxer failed: {stderr}")
             return False
         return True
     finally:
         if os.path.exists(list_file):
             os.remove(list_file)
 
-def get_gpu_args() -> List[str]:
-    """Detect if NVIDIA GPU is available and return appropriate ffmpeg args."""
+def _hidden_window_startupinfo():
+    """Return STARTUPINFO that hides the console window on Windows (None elsewhere)."""
+    if os.name != 'nt':
+        return None
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return startupinfo
+
+def decode_audio(path: str, sample_rate: int, start: Optional[float] = None,
+                 duration: Optional[float] = None) -> np.ndarray:
+    """
+    Decode the audio track of a media file into a mono float32 array at sample_rate.
+    FFmpeg writes raw f32le samples to stdout, so the whole track is decoded in a
+    single process without any intermediate WAV file. Slice the result by
+    int(seconds * sample_rate) to get individual segments.
+    Pass start/duration (seconds) to decode only that window; the input is seeked,
+    so a short window of a long recording costs about as much as the window itself.
+    """
+    command = [imageio_ffmpeg.get_ffmpeg_exe(), '-v', 'error']
+    if start:
+        command += ['-ss', f"{start:.6f}"]
+    if duration is not None:
+        command += ['-t', f"{duration:.6f}"]
+    command += [
+        '-i', str(path),
+        '-vn', '-ac', '1', '-ar', str(sample_rate),
+        '-f', 'f32le', '-'
+    ]
+    with tempfile.TemporaryFile() as err_file:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=err_file,
+                                startupinfo=_hidden_window_startupinfo())
+        if result.returncode != 0:
+            err_file.seek(0)
+            raise RuntimeError(f"Failed to decode audio from {path}: "
+                               f"{err_file.read().decode('utf-8', errors='replace')}")
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+_PTS_TIME_RE = re.compile(r"pts_time:\s*(-?[\d.]+)")
+
+def get_keyframe_times(path: str) -> List[float]:
+    """
+    Return the presentation times (seconds) of the video keyframes in `path`, sorted.
+    Only keyframes are decoded (-skip_frame nokey) and showinfo prints their timestamps,
+    so this works with the bundled ffmpeg binary alone (no ffprobe is shipped).
+    """
+    command = [
+        imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-nostats',
+        '-skip_frame', 'nokey', '-i', str(path),
+        '-an', '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-'
+    ]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            startupinfo=_hidden_window_startupinfo())
+    if result.returncode != 0:
+        return []
+    stderr = result.stderr.decode('utf-8', errors='replace')
+    return sorted(float(t) for t in _PTS_TIME_RE.findall(stderr))
+
+def snap_to_keyframe(keyframes: List[float], time_s: float):
+    """Return the last keyframe time at or before time_s, or None if there is none."""
+    i = bisect.bisect_right(keyframes, time_s)
+    return keyframes[i - 1] if i else None
+
+@functools.lru_cache(maxsize=1)
+def _detect_gpu_args() -> Tuple[str, ...]:
+    """Probe for an NVIDIA GPU once per process; the answer does not change during a run."""
     try:
-        subprocess.run(['nvidia-smi'], capture_output=True, check=True)
-        return ['-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'hq']
+        subprocess.run(['nvidia-smi'], capture_output=True, check=True,
+                       startupinfo=_hidden_window_startupinfo())
+        return ('-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'hq')
     except (subprocess.CalledProcessError, FileNotFoundError):
-        return ['-c:v', 'libx264', '-preset', 'medium']
\ No newline at end of file
+        return ('-c:v', 'libx264', '-preset', 'medium')
+
+def get_gpu_args() -> List[str]:
+    """Detect if NVIDIA GPU is available and return appropriate ffmpeg args."""
+    return list(_detect_gpu_args())
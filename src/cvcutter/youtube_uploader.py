@@ -12,23 +12,32 @@ YouTube Data API v3を使用した動画アップロードスクリプト
 
 import os
 import sys
-import json
 import time
 import random
+import hashlib
+import signal
 import logging
 import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from zoneinfo import ZoneInfo
 from typing import List, Dict, Optional, Tuple
 
 import google.auth.transport.requests
+from google.auth.exceptions import RefreshError, TransportError
 from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from googleapiclient.errors import HttpError, UnknownApiNameOrVersion
 from googleapiclient.http import MediaFileUpload
 from http.client import HTTPException
 
+from . import json_utils
+
 # ログ設定
 LOG_DIR = Path(__file__).parent / "logs"
 LOG_DIR.mkdir(exist_ok=True)
@@ -51,18 +60,51 @@ def get_resource_path(relative_path):
     return Path(__file__).parent.parent.parent / relative_path
 
 CLIENT_SECRETS_FILE = get_resource_path("client_secrets.json")
-TOKEN_PICKLE_FILE = get_resource_path("token.pickle")
+TOKEN_FILE = get_resource_path("token.json")
 
 # クォータ設定
 DAILY_QUOTA_LIMIT = 10000  # 1日のクォータ上限
 VIDEO_INSERT_COST = 1600   # 1回のアップロードコスト
 MAX_UPLOADS_PER_DAY = DAILY_QUOTA_LIMIT // VIDEO_INSERT_COST  # 6本/日
 
+# 再開可能アップロードのチャンクは256KiBの倍数である必要がある
+UPLOAD_CHUNK_GRANULARITY = 256 * 1024
+
+# videos().insertで送信するリソース部分（リクエストボディのキーと一致させる）
+UPLOAD_PART = "snippet,status"
+VIDEO_CATEGORY_ID = "10"  # 音楽カテゴリ
+
+# アップロード時に指定するMIMEタイプ
+UPLOAD_MIMETYPE = "video/*"
+MB = 1024 * 1024
+
+# 再生リスト追加のバッチリクエストに含める最大件数（APIの上限は50）
+PLAYLIST_BATCH_SIZE = 50
+
+# 並列アップロード数のデフォルト
+DEFAULT_MAX_WORKERS = 3
+
+# クォータのリセット基準となる太平洋時間
+# （WindowsにはIANAタイムゾーンデータベースがないため、tzdataパッケージに依存する）
+PACIFIC_TZ = ZoneInfo("America/Los_Angeles")
+
+# クォータリセット待ちの間に状態を確認する間隔（秒）
+QUOTA_RECHECK_INTERVAL = 300
+
+# 再実行時の重複アップロード防止に使うフィンガープリントの読み込みサイズ
+FINGERPRINT_HEAD_BYTES = 1024 * 1024
+
+# 有効期限までこの時間を切ったアクセストークンはアップロード前に更新する
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+_credentials_lock = threading.Lock()
+
 # 状態管理ファイル
 STATE_FILE = Path(__file__).parent / "upload_state.json"
 
 # リトライ設定
 MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0   # 秒
+MAX_RETRY_DELAY = 64.0   # 秒
 RETRIABLE_EXCEPTIONS = (
     HTTPException,
     IOError,
@@ -75,13 +117,18 @@ class QuotaExceededError(Exception):
     pass
 
 
+class UploadCancelledError(Exception):
+    """アップロードが中断要求により打ち切られた"""
+    pass
+
+
 def is_quota_exceeded(error: HttpError) -> bool:
     """HttpErrorがクォータ制限によるものか判定"""
     if not isinstance(error, HttpError):
         return False
     
     try:
-        content = json.loads(error.content.decode('utf-8'))
+        content = json_utils.loads(error.content)
         for err in content.get('error', {}).get('errors', []):
             if err.get('reason') == 'quotaExceeded':
                 return True
@@ -92,19 +139,58 @@ def is_quota_exceeded(error: HttpError) -> bool:
     return "quota" in str(error).lower()
 
 
+def file_fingerprint(path: Path) -> str:
+    """
+    ファイルの簡易フィンガープリントを計算
+
+    ファイル全体は読まず、絶対パス・更新時刻・ファイルサイズと先頭FINGERPRINT_HEAD_BYTESバイトのSHA-1を使う。
+    （同じ元動画から切り出した、先頭と長さが同じ別の動画を取り違えないよう、パスと更新時刻も含める）
+    """
+    path = path.resolve()
+    stat = path.stat()
+    digest = hashlib.sha1(usedforsecurity=False)
+    digest.update(os.fsencode(path))
+    digest.update(stat.st_mtime_ns.to_bytes(8, 'big'))
+    digest.update(stat.st_size.to_bytes(8, 'big'))
+    with open(path, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_HEAD_BYTES))
+    return digest.hexdigest()
+
+
 class QuotaManager:
-    """YouTube API クォータ管理クラス"""
+    """YouTube API クォータ管理クラス
 
-    def __init__(self, state_file: Path = STATE_FILE):
+    カウンターやリセット時刻などの小さな状態はstate_fileに、
+    増え続けるアップロード履歴は追記専用のJSONLファイルに保存する。
+    state_fileへの書き込みはflush()で行い、変更がない限り書き込まない。
+    利用側は処理の区切りと終了時（finally）にflush()を呼ぶこと。
+    """
+
+    def __init__(self, state_file: Path = STATE_FILE,
+                 stop_event: Optional[threading.Event] = None):
         self.state_file = state_file
+        # セットされるとクォータリセット待ちを中断する
+        self.stop_event = stop_event or threading.Event()
+        self.history_file = state_file.with_name(state_file.stem + "_history.jsonl")
+        # 並列アップロード時にstateの更新と保存が競合しないようにする
+        self._lock = threading.RLock()
+        self._dirty = False
         self.state = self._load_state()
+        if "success_count" not in self.state:
+            self._backfill_counters()
 
     def _load_state(self) -> Dict:
         """状態ファイルを読み込み"""
         if self.state_file.exists():
             try:
-                with open(self.state_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                state = json_utils.load_json(self.state_file)
+                # 旧形式（履歴を状態ファイル内に保持）からの移行
+                legacy_history = state.pop("upload_history", None)
+                if legacy_history:
+                    self._migrate_legacy_history(legacy_history)
+                if legacy_history is not None:
+                    self._dirty = True
+                return state
             except Exception as e:
                 logger.warning(f"状態ファイルの読み込みに失敗: {e}")
 
@@ -112,53 +198,99 @@ class QuotaManager:
         return {
             "quota_reset_time": self._get_next_quota_reset().isoformat(),
             "uploads_today": 0,
-            "upload_history": [],
             "pending_uploads": []
         }
 
+    def _migrate_legacy_history(self, entries: List[Dict]):
+        """状態ファイル内の履歴をJSONLファイルに移す"""
+        if self.history_file.exists():
+            return
+        with open(self.history_file, 'wb') as f:
+            for entry in entries:
+                f.write(json_utils.dumps(entry, indent=False) + b"\n")
+        logger.info(f"アップロード履歴を移行しました: {self.history_file}")
+
+    def _load_history(self) -> List[Dict]:
+        """アップロード履歴（JSONL）を読み込み"""
+        history = []
+        if not self.history_file.exists():
+            return history
+        try:
+            with open(self.history_file, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        history.append(json_utils.loads(line))
+                    except ValueError:
+                        # 書き込み途中で中断された行は無視する
+                        logger.warning("アップロード履歴の不正な行をスキップしました")
+        except Exception as e:
+            logger.warning(f"アップロード履歴の読み込みに失敗: {e}")
+        return history
+
+    def _backfill_counters(self):
+        """集計カウンターがない場合（新規・旧形式の状態ファイル）に、履歴から一度だけ集計する"""
+        history = self._load_history()
+        self.state["total_count"] = len(history)
+        self.state["success_count"] = sum(1 for h in history if h.get("status") == "success")
+        self.state["failed_count"] = sum(1 for h in history if h.get("status") == "failed")
+        self._dirty = True
+
     def _save_state(self):
-        """状態ファイルに保存"""
+        """状態ファイルに保存（一時ファイルに書いてから置き換える）"""
+        tmp_file = self.state_file.with_suffix(".json.tmp")
         try:
-            with open(self.state_file, 'w', encoding='utf-8') as f:
-                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            with self._lock:
+                json_utils.save_json(self.state, tmp_file)
+                os.replace(tmp_file, self.state_file)
+                self._dirty = False
         except Exception as e:
             logger.error(f"状態ファイルの保存に失敗: {e}")
 
+    def flush(self):
+        """変更があれば状態ファイルに保存"""
+        with self._lock:
+            if self._dirty:
+                self._save_state()
+
     def _get_next_quota_reset(self) -> datetime:
         """次のクォータリセット時刻を取得（太平洋時間の午前0時）"""
-        # 太平洋時間のタイムゾーン（UTCから-8時間または-7時間、夏時間考慮）
-        # 簡易的にUTC-8として計算
-        now_utc = datetime.now(timezone.utc)
-        pacific_offset = timedelta(hours=-8)
-        now_pacific = now_utc + pacific_offset
-
-        # 太平洋時間の次の午前0時
+        # 夏時間（PDT, UTC-7）を考慮した太平洋時間の次の午前0時
+        now_pacific = datetime.now(PACIFIC_TZ)
         next_midnight_pacific = (now_pacific + timedelta(days=1)).replace(
             hour=0, minute=0, second=0, microsecond=0
         )
-
-        # UTCに戻す
-        next_midnight_utc = next_midnight_pacific - pacific_offset
-        return next_midnight_utc
+        return next_midnight_pacific.astimezone(timezone.utc)
 
     def check_and_reset_quota(self):
         """クォータをチェックし、必要に応じてリセット"""
-        reset_time = datetime.fromisoformat(self.state["quota_reset_time"])
-        now = datetime.now(timezone.utc)
+        with self._lock:
+            reset_time = datetime.fromisoformat(self.state["quota_reset_time"])
+            now = datetime.now(timezone.utc)
+
+            if now >= reset_time:
+                logger.info("クォータをリセットしました")
+                self.state["uploads_today"] = 0
+                self.state["quota_reset_time"] = self._get_next_quota_reset().isoformat()
+                self._dirty = True
+
+    def can_upload(self, in_flight: int = 0) -> bool:
+        """アップロード可能かチェック（in_flight: 実行中でまだカウントされていない本数）"""
+        self.check_and_reset_quota()
+        with self._lock:
+            return self.state["uploads_today"] + in_flight < MAX_UPLOADS_PER_DAY
 
-        if now >= reset_time:
-            logger.info("クォータをリセットしました")
-            self.state["uploads_today"] = 0
-            self.state["quota_reset_time"] = self._get_next_quota_reset().isoformat()
-            self._save_state()
+    def wait_for_quota_reset(self) -> bool:
+        """
+        クォータリセットまで待機
 
-    def can_upload(self) -> bool:
-        """アップロード可能かチェック"""
-        self.check_and_reset_quota()
-        return self.state["uploads_today"] < MAX_UPLOADS_PER_DAY
+        QUOTA_RECHECK_INTERVAL秒ごとに状態を確認し、stop_eventがセットされたら中断する。
 
-    def wait_for_quota_reset(self):
-        """クォータリセットまで待機"""
+        Returns:
+            アップロードを再開できる場合はTrue、中断された場合はFalse
+        """
         reset_time = datetime.fromisoformat(self.state["quota_reset_time"])
         now = datetime.now(timezone.utc)
 
@@ -170,18 +302,27 @@ class QuotaManager:
             logger.info(f"クォータリセットまで {wait_hours:.1f} 時間待機します...")
             logger.info(f"再開予定時刻: {reset_time.astimezone()}")
 
-            time.sleep(wait_seconds)
-            self.check_and_reset_quota()
+            self.flush()
+            while not self.can_upload():
+                remaining = (datetime.fromisoformat(self.state["quota_reset_time"])
+                             - datetime.now(timezone.utc)).total_seconds()
+                if self.stop_event.wait(min(QUOTA_RECHECK_INTERVAL, max(remaining, 1.0))):
+                    logger.info("クォータリセット待ちを中断しました")
+                    return False
+
+        return not self.stop_event.is_set()
 
     def increment_upload_count(self):
         """アップロードカウントをインクリメント"""
-        self.state["uploads_today"] += 1
-        self._save_state()
+        with self._lock:
+            self.state["uploads_today"] += 1
+            self._dirty = True
 
     def set_quota_exceeded(self):
         """クォータ制限に達したことを記録"""
-        self.state["uploads_today"] = MAX_UPLOADS_PER_DAY
-        self._save_state()
+        with self._lock:
+            self.state["uploads_today"] = MAX_UPLOADS_PER_DAY
+            self._dirty = True
 
     def add_upload_history(self, file_path: str, video_id: Optional[str],
                           status: str, error: Optional[str] = None):
@@ -195,36 +336,105 @@ class QuotaManager:
         if error:
             history_entry["error"] = error
 
-        self.state["upload_history"].append(history_entry)
-        self._save_state()
+        with self._lock:
+            self.state["total_count"] += 1
+            if status == "success":
+                self.state["success_count"] += 1
+            elif status == "failed":
+                self.state["failed_count"] += 1
+            self._dirty = True
+            try:
+                with open(self.history_file, 'ab') as f:
+                    f.write(json_utils.dumps(history_entry, indent=False) + b"\n")
+            except Exception as e:
+                logger.error(f"アップロード履歴の保存に失敗: {e}")
+
+    def get_uploaded_video_id(self, fingerprint: str) -> Optional[str]:
+        """同じフィンガープリントのファイルをアップロード済みならそのvideo_idを返す"""
+        with self._lock:
+            return self.state.get("uploaded_fingerprints", {}).get(fingerprint)
+
+    def record_uploaded(self, fingerprint: str, video_id: str):
+        """アップロードしたファイルのフィンガープリントを記録"""
+        with self._lock:
+            self.state.setdefault("uploaded_fingerprints", {})[fingerprint] = video_id
+            self._dirty = True
+
+    def add_playlist_failures(self, items: List[Tuple[str, str]]):
+        """再生リストへの追加に失敗した (video_id, playlist_id) を次回の再試行用に記録"""
+        with self._lock:
+            failures = self.state.setdefault("playlist_failures", [])
+            failures.extend([video_id, playlist_id] for video_id, playlist_id in items)
+            self._dirty = True
+
+    def pop_playlist_failures(self) -> List[Tuple[str, str]]:
+        """記録済みの再生リスト追加の失敗を取り出す（取り出した分は記録から消す）"""
+        with self._lock:
+            failures = self.state.pop("playlist_failures", [])
+            if failures:
+                self._dirty = True
+            return [(video_id, playlist_id) for video_id, playlist_id in failures]
 
     def get_upload_summary(self) -> Dict:
         """アップロード結果のサマリーを取得"""
-        history = self.state["upload_history"]
         return {
-            "total": len(history),
-            "success": sum(1 for h in history if h["status"] == "success"),
-            "failed": sum(1 for h in history if h["status"] == "failed"),
+            "total": self.state["total_count"],
+            "success": self.state["success_count"],
+            "failed": self.state["failed_count"],
             "uploads_today": self.state["uploads_today"],
             "quota_reset_time": self.state["quota_reset_time"]
         }
 
 
-def authenticate(client_secrets_path: Optional[Path] = None) -> object:
+def _load_token(token_file: Path, legacy_token_file: Path):
     """
-    OAuth 2.0認証を実行し、YouTube APIサービスオブジェクトを返す
+    保存済みの認証情報を読み込む
 
     Returns:
-        YouTubeサービスオブジェクト
+        (認証情報またはNone, 保存し直す必要があるか)
     """
-    credentials = None
+    if token_file.exists():
+        try:
+            return Credentials.from_authorized_user_file(str(token_file), SCOPES), False
+        except (ValueError, OSError) as e:
+            logger.warning(f"トークンファイルの読み込みに失敗しました。再認証します: {e}")
+            return None, False
+
+    # 旧形式（pickle）のトークンがあればJSON形式に移行する
+    if legacy_token_file.exists():
+        try:
+            with open(legacy_token_file, 'rb') as token:
+                return pickle.load(token), True
+        except Exception as e:
+            logger.warning(f"旧形式のトークンファイルの読み込みに失敗しました: {e}")
+
+    return None, False
+
+
+def _token_file_path(client_secrets_path: Optional[Path] = None) -> Path:
+    """client_secrets.jsonと同じディレクトリにあるtoken.jsonのパス"""
     secrets_file = client_secrets_path if client_secrets_path else CLIENT_SECRETS_FILE
-    token_file = secrets_file.parent / "token.pickle"
+    return secrets_file.parent / "token.json"
 
-    # トークンファイルが存在する場合は読み込み
-    if token_file.exists():
-        with open(token_file, 'rb') as token:
-            credentials = pickle.load(token)
+
+def _save_token(credentials, token_file: Path):
+    """認証情報をtoken.jsonに保存"""
+    with open(token_file, 'w', encoding='utf-8') as token:
+        token.write(credentials.to_json())
+
+
+def get_credentials(client_secrets_path: Optional[Path] = None):
+    """
+    OAuth 2.0認証を実行し、認証情報を返す
+
+    Returns:
+        認証情報（google.oauth2.credentials.Credentials）
+    """
+    secrets_file = client_secrets_path if client_secrets_path else CLIENT_SECRETS_FILE
+    token_file = _token_file_path(client_secrets_path)
+    legacy_token_file = secrets_file.parent / "token.pickle"
+
+    credentials, needs_save = _load_token(token_file, legacy_token_file)
 
     # 認証情報が無効な場合は再認証
     if not credentials or not credentials.valid:
@@ -243,14 +453,71 @@ def authenticate(client_secrets_path: Optional[Path] = None) -> object:
                 str(secrets_file), SCOPES
             )
             credentials = flow.run_local_server(port=0)
+        needs_save = True
 
+    if needs_save:
         # トークンを保存
-        with open(token_file, 'wb') as token:
-            pickle.dump(credentials, token)
+        _save_token(credentials, token_file)
         logger.info("認証情報を保存しました")
+        if legacy_token_file.exists():
+            try:
+                legacy_token_file.unlink()
+            except OSError as e:
+                logger.warning(f"旧形式のトークンファイルを削除できませんでした: {e}")
+
+    return credentials
 
-    # Disable discovery cache to avoid errors in frozen environments
-    return build(API_SERVICE_NAME, API_VERSION, credentials=credentials, static_discovery=False)
+
+def ensure_fresh(credentials, token_file: Optional[Path] = None):
+    """
+    アクセストークンの有効期限が近ければ事前に更新する
+
+    長時間のバッチ実行中に、アップロードの途中でトークンが失効するのを避ける。
+    更新に成功したらtoken_fileに保存し、次回の実行が古いトークンから始まらないようにする。
+    ここでの更新はロックで直列化するが、google-auth-httplib2がワーカー内で
+    401応答を受けて行う更新はこのロックを通らない。
+    更新に失敗しても例外は送出せず、その場合はトランスポート側の401時の更新に任せる。
+    """
+    with _credentials_lock:
+        expiry = getattr(credentials, "expiry", None)
+        if expiry is None or not getattr(credentials, "refresh_token", None):
+            return
+        # google-authのexpiryはタイムゾーンなしのUTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        if expiry - now < TOKEN_REFRESH_MARGIN:
+            logger.info("アクセストークンの有効期限が近いため更新しています...")
+            try:
+                credentials.refresh(Request())
+            except (RefreshError, TransportError) as e:
+                logger.warning(f"アクセストークンの事前更新に失敗しました: {e}")
+                return
+            if token_file is not None:
+                try:
+                    _save_token(credentials, token_file)
+                except OSError as e:
+                    logger.warning(f"更新したトークンを保存できませんでした: {e}")
+
+
+def build_service(credentials) -> object:
+    """認証情報からYouTube APIサービスオブジェクトを生成"""
+    # googleapiclientに同梱されたディスカバリードキュメントを使い、ネットワーク取得を省く
+    try:
+        return build(API_SERVICE_NAME, API_VERSION, credentials=credentials,
+                     static_discovery=True, cache_discovery=False)
+    except UnknownApiNameOrVersion:
+        # 同梱ドキュメントが見つからない場合（古いexeビルドなど）はネットワークから取得
+        logger.debug("同梱のディスカバリードキュメントが見つからないため、ネットワークから取得します")
+        return build(API_SERVICE_NAME, API_VERSION, credentials=credentials, static_discovery=False)
+
+
+def authenticate(client_secrets_path: Optional[Path] = None) -> object:
+    """
+    OAuth 2.0認証を実行し、YouTube APIサービスオブジェクトを返す
+
+    Returns:
+        YouTubeサービスオブジェクト
+    """
+    return build_service(get_credentials(client_secrets_path))
 
 
 def load_upload_metadata(metadata_file: Path) -> Dict:
@@ -266,21 +533,76 @@ def load_upload_metadata(metadata_file: Path) -> Dict:
     if not metadata_file.exists():
         raise FileNotFoundError(f"メタデータファイルが見つかりません: {metadata_file}")
 
-    with open(metadata_file, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return json_utils.load_json(metadata_file)
+
+
+class PrefetchingMediaFileUpload(MediaFileUpload):
+    """
+    送信中に次のチャンクをバックグラウンドで読み込んでおくMediaFileUpload
+
+    通常はnext_chunk()のたびに「ディスク読み込み → 送信 → 応答待ち」が直列に行われるが、
+    応答待ちの間に次のチャンクを先読みしておくことでディスク読み込みの時間を隠す。
+    先読みは常に1チャンクまでなので、メモリ使用量はチャンクサイズの2倍程度に収まる。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetch = None  # (開始位置, 長さ, Future)
+
+    def has_stream(self):
+        # ストリームではなくgetbytes()経由で読み込ませる
+        return False
+
+    def _read(self, begin: int, length: int) -> bytes:
+        self._fd.seek(begin)
+        return self._fd.read(length)
+
+    def getbytes(self, begin, length):
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None and prefetch[:2] == (begin, length):
+            data = prefetch[2].result()
+        else:
+            # リトライで再開位置が変わった場合など。ファイルハンドルを共有しているので先読みの完了を待つ
+            if prefetch is not None:
+                prefetch[2].result()
+            data = self._read(begin, length)
+
+        next_begin = begin + len(data)
+        if len(data) == length and next_begin < self.size():
+            self._prefetch = (next_begin, length,
+                              self._prefetch_executor.submit(self._read, next_begin, length))
+        return data
+
+    def close(self):
+        """先読みスレッドとファイルを閉じる"""
+        self._prefetch = None
+        self._prefetch_executor.shutdown(wait=True)
+        self._fd.close()
+
+
+def _retry_delay(attempt: int) -> float:
+    """指数バックオフ + ジッターによる待機秒数"""
+    return min(MAX_RETRY_DELAY, RETRY_BASE_DELAY * (2 ** attempt)) * (0.5 + random.random() * 0.5)
 
 
 def upload_video(youtube, video_file: Path, metadata: Dict,
-                retry_count: int = 0, chunk_size: int = 1048576) -> Optional[str]:
+                 chunk_size: int = 1048576, add_to_playlist: bool = True,
+                 abort_event: Optional[threading.Event] = None) -> Optional[str]:
     """
     1本の動画をYouTubeにアップロード
 
+    一時的なエラーの際は同じ再開可能セッションでnext_chunk()を再実行するため、
+    送信済みのチャンクを再送することはない。
+
     Args:
         youtube: YouTubeサービスオブジェクト
         video_file: アップロードする動画ファイル
         metadata: 動画のメタデータ
-        retry_count: リトライ回数
         chunk_size: アップロードのチャンクサイズ（バイト）
+        add_to_playlist: metadataのplaylist_idの再生リストに追加するか
+            （Falseの場合は呼び出し側でまとめて追加する）
+        abort_event: セットされると次のチャンクを送る前にUploadCancelledErrorで中断する
 
     Returns:
         アップロードされた動画のvideo_id（失敗時はNone）
@@ -291,7 +613,7 @@ def upload_video(youtube, video_file: Path, metadata: Dict,
             "title": metadata.get("title", video_file.stem),
             "description": metadata.get("description", ""),
             "tags": metadata.get("tags", []),
-            "categoryId": "10",  # 音楽カテゴリ
+            "categoryId": VIDEO_CATEGORY_ID,
             "defaultLanguage": "ja",
             "defaultAudioLanguage": "ja"
         },
@@ -302,92 +624,106 @@ def upload_video(youtube, video_file: Path, metadata: Dict,
     }
 
     # MediaFileUploadオブジェクトの作成
-    media = MediaFileUpload(
+    # デフォルト（5MB = 256KiB×20）はそのまま通るが、設定ファイルで任意の値を指定できるため
+    # 256KiBの倍数でない値は切り下げる
+    chunk_size = max(UPLOAD_CHUNK_GRANULARITY,
+                     chunk_size // UPLOAD_CHUNK_GRANULARITY * UPLOAD_CHUNK_GRANULARITY)
+    # mimetypeを明示して拡張子からの推測を省く（YouTubeはvideo/*を受け付ける）
+    media = PrefetchingMediaFileUpload(
         str(video_file),
+        mimetype=UPLOAD_MIMETYPE,
         chunksize=chunk_size,
         resumable=True
     )
 
-    try:
-        # アップロードリクエストの作成
-        insert_request = youtube.videos().insert(
-            part=",".join(body.keys()),
-            body=body,
-            media_body=media
-        )
+    # アップロードリクエストの作成
+    insert_request = youtube.videos().insert(
+        part=UPLOAD_PART,
+        body=body,
+        media_body=media
+    )
 
-        # 再開可能アップロードの実行
-        logger.info(f"アップロード開始: {video_file.name}")
-        response = None
+    # 再開可能アップロードの実行
+    logger.info(f"アップロード開始: {video_file.name} ({media.size() / MB:.1f} MB)")
+    response = None
+    retry_count = 0
+    last_logged_progress = -10
+    log_progress = logger.isEnabledFor(logging.INFO)
+    start_time = time.monotonic()
 
+    try:
         while response is None:
+            if abort_event is not None and abort_event.is_set():
+                raise UploadCancelledError(f"アップロードを中断しました: {video_file.name}")
             try:
                 status, response = insert_request.next_chunk()
-                if status:
+                if status and log_progress:
                     progress = int(status.progress() * 100)
-                    logger.info(f"  進捗: {progress}%")
+                    # ログが多くなりすぎないよう10%刻みで出力
+                    if progress >= last_logged_progress + 10:
+                        elapsed = time.monotonic() - start_time
+                        speed = status.resumable_progress / MB / elapsed if elapsed > 0 else 0.0
+                        logger.info(f"  進捗: {progress}% ({speed:.1f} MB/s)")
+                        last_logged_progress = progress - progress % 10
+                # チャンクが受理されたら連続失敗数をリセット
+                retry_count = 0
+                continue
+
             except HttpError as e:
-                if e.resp.status in RETRIABLE_STATUS_CODES:
-                    # リトライ可能なエラー
-                    if retry_count < MAX_RETRIES:
-                        sleep_seconds = random.random() * (2 ** retry_count)
-                        logger.warning(
-                            f"HTTPエラー {e.resp.status} が発生。"
-                            f"{sleep_seconds:.1f}秒後にリトライします... "
-                            f"(試行 {retry_count + 1}/{MAX_RETRIES})"
-                        )
-                        time.sleep(sleep_seconds)
-                        return upload_video(youtube, video_file, metadata, retry_count + 1)
-                    else:
-                        if is_quota_exceeded(e):
-                            raise QuotaExceededError(str(e))
-                        raise
-                else:
-                    if is_quota_exceeded(e):
-                        raise QuotaExceededError(str(e))
+                if is_quota_exceeded(e):
+                    raise QuotaExceededError(str(e))
+                if e.resp.status not in RETRIABLE_STATUS_CODES:
+                    logger.error(f"HTTPエラーが発生: {e}")
                     raise
+                error_desc = f"HTTPエラー {e.resp.status} が発生。"
+                last_error = e
 
-        video_id = response.get("id")
-        logger.info(f"✓ アップロード成功: {video_file.name} (ID: {video_id})")
-        
-        # メタデータにvideo_idとURLを追加
-        metadata['video_id'] = video_id
-        metadata['video_url'] = f"https://www.youtube.com/watch?v={video_id}"
+            except RETRIABLE_EXCEPTIONS as e:
+                error_desc = f"一時的なエラーが発生: {e}\n"
+                last_error = e
 
-        # 再生リストに追加（指定されている場合）
-        playlist_id = metadata.get("playlist_id")
-        if playlist_id:
-            try:
-                add_video_to_playlist(youtube, video_id, playlist_id)
-                logger.info(f"  再生リストに追加しました: {playlist_id}")
             except Exception as e:
-                logger.warning(f"  再生リストへの追加に失敗: {e}")
+                logger.error(f"予期しないエラーが発生: {e}")
+                raise
 
-        return video_id
+            # リトライ可能なエラー: 同じセッションで最後に受理されたバイトから再開する
+            if retry_count >= MAX_RETRIES:
+                logger.error(f"最大リトライ回数に達しました: {video_file.name}")
+                raise last_error
 
-    except RETRIABLE_EXCEPTIONS as e:
-        if retry_count < MAX_RETRIES:
-            sleep_seconds = random.random() * (2 ** retry_count)
+            sleep_seconds = _retry_delay(retry_count)
+            retry_count += 1
             logger.warning(
-                f"一時的なエラーが発生: {e}\n"
+                f"{error_desc}"
                 f"{sleep_seconds:.1f}秒後にリトライします... "
-                f"(試行 {retry_count + 1}/{MAX_RETRIES})"
+                f"(試行 {retry_count}/{MAX_RETRIES})"
             )
-            time.sleep(sleep_seconds)
-            return upload_video(youtube, video_file, metadata, retry_count + 1)
-        else:
-            logger.error(f"最大リトライ回数に達しました: {video_file.name}")
-            raise
-
-    except HttpError as e:
-        if is_quota_exceeded(e):
-            raise QuotaExceededError(str(e))
-        logger.error(f"HTTPエラーが発生: {e}")
-        raise
+            if abort_event is not None:
+                abort_event.wait(sleep_seconds)
+            else:
+                time.sleep(sleep_seconds)
+    finally:
+        media.close()
+
+    video_id = response.get("id")
+    elapsed = time.monotonic() - start_time
+    speed = media.size() / MB / elapsed if elapsed > 0 else 0.0
+    logger.info(f"✓ アップロード成功: {video_file.name} (ID: {video_id}, {elapsed:.0f}秒, {speed:.1f} MB/s)")
+
+    # メタデータにvideo_idとURLを追加
+    metadata['video_id'] = video_id
+    metadata['video_url'] = f"https://www.youtube.com/watch?v={video_id}"
+
+    # 再生リストに追加（指定されている場合）
+    playlist_id = metadata.get("playlist_id")
+    if add_to_playlist and playlist_id:
+        try:
+            add_video_to_playlist(youtube, video_id, playlist_id)
+            logger.info(f"  再生リストに追加しました: {playlist_id}")
+        except Exception as e:
+            logger.warning(f"  再生リストへの追加に失敗: {e}")
 
-    except Exception as e:
-        logger.error(f"予期しないエラーが発生: {e}")
-        raise
+    return video_id
 
 
 def add_video_to_playlist(youtube, video_id: str, playlist_id: str):
@@ -413,17 +749,89 @@ def add_video_to_playlist(youtube, video_id: str, playlist_id: str):
     ).execute()
 
 
+def add_videos_to_playlists(youtube, items: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    複数の動画をバッチリクエストでまとめて再生リストに追加
+
+    Args:
+        youtube: YouTubeサービスオブジェクト
+        items: (video_id, playlist_id) のリスト
+
+    Returns:
+        追加に失敗した (video_id, playlist_id) のリスト
+    """
+    failed = []
+    for start in range(0, len(items), PLAYLIST_BATCH_SIZE):
+        chunk = items[start:start + PLAYLIST_BATCH_SIZE]
+        errors = {}
+
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                errors[int(request_id)] = exception
+
+        batch = youtube.new_batch_http_request(callback=on_response)
+        for i, (video_id, playlist_id) in enumerate(chunk):
+            batch.add(youtube.playlistItems().insert(
+                part="snippet",
+                body={
+                    "snippet": {
+                        "playlistId": playlist_id,
+                        "resourceId": {
+                            "kind": "youtube#video",
+                            "videoId": video_id
+                        }
+                    }
+                }
+            ), request_id=str(i))
+
+        try:
+            batch.execute()
+        except Exception as e:
+            # バッチ自体が失敗した場合は1件ずつ追加する
+            logger.warning(f"再生リストへの一括追加に失敗したため、1件ずつ追加します: {e}")
+            errors = {}
+            for i, (video_id, playlist_id) in enumerate(chunk):
+                try:
+                    add_video_to_playlist(youtube, video_id, playlist_id)
+                except Exception as item_error:
+                    errors[i] = item_error
+
+        for i, (video_id, playlist_id) in enumerate(chunk):
+            if i in errors:
+                logger.warning(f"  再生リストへの追加に失敗 ({video_id} -> {playlist_id}): {errors[i]}")
+                failed.append((video_id, playlist_id))
+            else:
+                logger.info(f"  再生リストに追加しました: {video_id} -> {playlist_id}")
+
+    return failed
+
+
 def batch_upload(metadata_file: Path,
                  client_secrets_path: Optional[Path] = None,
                  confirm_callback=None,
-                 chunk_size: int = 1048576) -> Tuple[Dict, Dict]:
+                 chunk_size: int = 1048576,
+                 max_workers: int = DEFAULT_MAX_WORKERS,
+                 stop_event: Optional[threading.Event] = None,
+                 credentials=None,
+                 ignore_uploaded: bool = False) -> Tuple[Dict, Dict]:
     """
     複数の動画をバッチアップロード
 
+    アップロードはネットワーク待ちが支配的なため、max_workers本まで並列に実行する。
+    googleapiclientのHTTPクライアントはスレッドセーフではないので、
+    サービスオブジェクトはワーカースレッドごとに生成する。
+
     Args:
         metadata_file: メタデータJSONファイル
         client_secrets_path: client_secrets.jsonのパス（オプション）
         confirm_callback: ユーザー確認用コールバック関数 (video_files, metadata) -> bool
+        chunk_size: アップロードのチャンクサイズ（バイト）
+        max_workers: 同時にアップロードする最大本数
+        stop_event: セットされると新しいアップロードの開始とクォータリセット待ちを中断する
+            （実行中のアップロードは完了まで待つ）
+        credentials: 取得済みの認証情報（省略時はここでget_credentialsを呼ぶ）
+        ignore_uploaded: Trueの場合、以前アップロードしたファイルの記録を無視して再アップロードする
+            （YouTube側で動画を削除した場合など）
 
     Returns:
         (更新されたメタデータ, アップロード結果のサマリー)
@@ -432,79 +840,183 @@ def batch_upload(metadata_file: Path,
     logger.info("YouTube 動画バッチアップロード開始")
     logger.info("=" * 60)
 
-    # 認証
+    # 認証（ブラウザ認証が必要な場合に備えて、ここで一度だけ行う）
     logger.info("YouTube APIに接続しています...")
-    youtube = authenticate(client_secrets_path=client_secrets_path)
+    if credentials is None:
+        credentials = get_credentials(client_secrets_path=client_secrets_path)
+    token_file = _token_file_path(client_secrets_path)
+    thread_local = threading.local()
+    # KeyboardInterruptなどで抜ける場合に、実行中のアップロードを次のチャンクで打ち切らせる
+    abort_event = threading.Event()
+
+    def upload_in_worker(video_file: Path, video_metadata: Dict) -> Optional[str]:
+        youtube = getattr(thread_local, "youtube", None)
+        if youtube is None:
+            youtube = thread_local.youtube = build_service(credentials)
+        return upload_video(youtube, video_file, video_metadata,
+                            chunk_size=chunk_size, add_to_playlist=False,
+                            abort_event=abort_event)
 
     # クォータマネージャーの初期化
-    quota_manager = QuotaManager()
-
-    # メタデータの読み込み
-    logger.info(f"メタデータを読み込んでいます: {metadata_file}")
-    metadata = load_upload_metadata(metadata_file)
-    video_metadata_list = metadata.get("videos", [])
-
-    if not video_metadata_list:
-        logger.warning("アップロード対象の動画がメタデータ内に見つかりません。")
-        return metadata, quota_manager.get_upload_summary()
-        
-    # バッチアップロード実行
-    i = 0
-    while i < len(video_metadata_list):
-        video_metadata = video_metadata_list[i]
-        video_path_str = video_metadata.get("file_path")
-        
-        if not video_path_str:
-            logger.warning(f"メタデータ {i+1} に 'file_path' がありません。スキップします。")
-            i += 1
-            continue
-            
-        video_file = Path(video_path_str)
-        if not video_file.exists():
-            logger.warning(f"動画ファイルが見つかりません: {video_file}。スキップします。")
-            i += 1
-            continue
-            
-        # 既にアップロード済みの場合はスキップ（video_idがある場合）
-        if video_metadata.get("video_id"):
-            logger.info(f"スキップ（アップロード済み）: {video_file.name}")
-            i += 1
-            continue
-
-        logger.info(f"\n[{i+1}/{len(video_metadata_list)}] {video_file.name}")
-        logger.info(f"タイトル: {video_metadata.get('title')}")
-
-        # クォータチェック
-        if not quota_manager.can_upload():
-            quota_manager.wait_for_quota_reset()
-
-        # アップロード実行
+    stop_event = stop_event or threading.Event()
+    quota_manager = QuotaManager(stop_event=stop_event)
+
+    playlist_items = []
+    playlist_service = None
+
+    def flush_playlist_items():
+        """溜まった再生リストへの追加を実行し、失敗した分は次回の再試行用に記録する"""
+        nonlocal playlist_service
+        if not playlist_items:
+            return
+        items = playlist_items[:]
+        playlist_items.clear()
+        logger.info(f"{len(items)} 本の動画を再生リストに追加しています...")
         try:
-            # upload_videoがvideo_metadataを更新する
-            video_id = upload_video(youtube, video_file, video_metadata, chunk_size=chunk_size)
-            quota_manager.add_upload_history(
-                str(video_file), video_id, "success"
-            )
-            quota_manager.increment_upload_count()
-            i += 1 # 成功したら次へ
+            if playlist_service is None:
+                playlist_service = build_service(credentials)
+            failed = add_videos_to_playlists(playlist_service, items)
+        except Exception as e:
+            logger.error(f"再生リストへの追加に失敗しました: {e}")
+            failed = items
+        if failed:
+            logger.warning(f"再生リストに追加できなかった {len(failed)} 本は次回のアップロード時に再試行します")
+            quota_manager.add_playlist_failures(failed)
 
-        except QuotaExceededError:
-            logger.warning("APIからクォータ制限エラーを受け取りました。")
-            quota_manager.set_quota_exceeded()
-            quota_manager.wait_for_quota_reset()
-            # リセット待機後、インデックス i は進めずにループを継続（再試行）
-            continue
+    try:
+        # メタデータの読み込み
+        logger.info(f"メタデータを読み込んでいます: {metadata_file}")
+        metadata = load_upload_metadata(metadata_file)
+        video_metadata_list = metadata.get("videos", [])
+
+        if not video_metadata_list:
+            logger.warning("アップロード対象の動画がメタデータ内に見つかりません。")
+            return metadata, quota_manager.get_upload_summary()
+
+        # アップロード対象の抽出
+        pending = deque()
+        for i, video_metadata in enumerate(video_metadata_list):
+            video_path_str = video_metadata.get("file_path")
+
+            if not video_path_str:
+                logger.warning(f"メタデータ {i+1} に 'file_path' がありません。スキップします。")
+                continue
+
+            video_file = Path(video_path_str)
+            if not video_file.exists():
+                logger.warning(f"動画ファイルが見つかりません: {video_file}。スキップします。")
+                continue
+
+            # 既にアップロード済みの場合はスキップ（video_idがある場合）
+            if video_metadata.get("video_id"):
+                logger.info(f"スキップ（アップロード済み）: {video_file.name}")
+                continue
+
+            # 同じファイルを以前アップロードしていればそのvideo_idを使う
+            fingerprint = file_fingerprint(video_file)
+            uploaded_id = None if ignore_uploaded else quota_manager.get_uploaded_video_id(fingerprint)
+            if uploaded_id:
+                logger.info(f"スキップ（同じ内容のファイルをアップロード済み）: {video_file.name} (ID: {uploaded_id})")
+                video_metadata['video_id'] = uploaded_id
+                video_metadata['video_url'] = f"https://www.youtube.com/watch?v={uploaded_id}"
+                continue
+
+            pending.append((i, video_file, video_metadata, fingerprint))
+
+        # バッチアップロード実行
+        max_workers = max(1, max_workers)
+        in_flight = {}
+        # 再生リストへの追加はPLAYLIST_BATCH_SIZE件ごと・クォータ待ちの前・終了時にまとめて行う
+        # （前回失敗した分もここで再試行する）
+        playlist_items.extend(quota_manager.pop_playlist_failures())
+
+        def record_result(future, item):
+            """完了したアップロード1件の結果を状態に記録する"""
+            _, video_file, video_metadata, fingerprint = item
+            try:
+                # upload_videoがvideo_metadataを更新する
+                video_id = future.result()
 
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"✗ アップロード失敗: {video_file.name}")
-            logger.error(f"  エラー: {error_msg}")
-            quota_manager.add_upload_history(
-                str(video_file), None, "failed", error_msg
-            )
-            # 致命的なエラーや不明なエラーはスキップして次へ
-            i += 1
-            continue
+            except UploadCancelledError:
+                # 中断で打ち切られた分は未アップロードのまま残す
+                pending.appendleft(item)
+                return
+
+            except QuotaExceededError:
+                logger.warning("APIからクォータ制限エラーを受け取りました。")
+                quota_manager.set_quota_exceeded()
+                # リセット後に再試行するため、キューの先頭に戻す
+                pending.appendleft(item)
+
+            except Exception as e:
+                error_msg = str(e)
+                logger.error(f"✗ アップロード失敗: {video_file.name}")
+                logger.error(f"  エラー: {error_msg}")
+                quota_manager.add_upload_history(
+                    str(video_file), None, "failed", error_msg
+                )
+                # 致命的なエラーや不明なエラーはスキップして次へ
+
+            else:
+                # アップロード自体は成功しているので、ここでの例外を失敗として記録しない
+                quota_manager.add_upload_history(
+                    str(video_file), video_id, "success"
+                )
+                quota_manager.increment_upload_count()
+                quota_manager.record_uploaded(fingerprint, video_id)
+                playlist_id = video_metadata.get("playlist_id")
+                if playlist_id:
+                    playlist_items.append((video_id, playlist_id))
+                    if len(playlist_items) >= PLAYLIST_BATCH_SIZE:
+                        flush_playlist_items()
+
+            quota_manager.flush()
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            while (pending and not stop_event.is_set()) or in_flight:
+                # クォータの範囲内で空いているワーカーに投入
+                while (pending and not stop_event.is_set() and len(in_flight) < max_workers
+                       and quota_manager.can_upload(len(in_flight))):
+                    item = pending.popleft()
+                    i, video_file, video_metadata, _ = item
+                    ensure_fresh(credentials, token_file)
+                    logger.info(f"\n[{i+1}/{len(video_metadata_list)}] {video_file.name}")
+                    logger.info(f"タイトル: {video_metadata.get('title')}")
+                    future = executor.submit(upload_in_worker, video_file, video_metadata)
+                    in_flight[future] = item
+
+                if not in_flight:
+                    if stop_event.is_set():
+                        break
+                    # 投入できるものがない = クォータ上限。長時間待つ前に再生リストへ追加しておく
+                    flush_playlist_items()
+                    if not quota_manager.wait_for_quota_reset():
+                        break
+                    continue
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # 記録中に例外が起きてもfinallyで二重に記録しないよう、先に取り除く
+                    record_result(future, in_flight.pop(future))
+        except BaseException:
+            # 2回目のCtrl-Cなど: 実行中のアップロードを待たずに打ち切る
+            abort_event.set()
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            # 例外で抜けた場合も、完了済みのアップロード結果は必ず記録する
+            while in_flight:
+                future, item = in_flight.popitem()
+                if not future.cancelled():
+                    record_result(future, item)
+
+        if stop_event.is_set() and pending:
+            logger.warning(f"中断されたため、{len(pending)} 本の動画をアップロードしていません")
+    finally:
+        # 途中で例外が発生しても、それまでの再生リスト追加と状態を保存する
+        flush_playlist_items()
+        quota_manager.flush()
 
     # 結果サマリー
     summary = quota_manager.get_upload_summary()
@@ -533,11 +1045,46 @@ def main():
         default=Path(__file__).parent / "upload_metadata.json",
         help="メタデータJSONファイル（デフォルト: upload_metadata.json）"
     )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"同時にアップロードする最大本数（デフォルト: {DEFAULT_MAX_WORKERS}）"
+    )
+    parser.add_argument(
+        "--force", "--ignore-uploaded",
+        dest="ignore_uploaded",
+        action="store_true",
+        help="以前アップロードしたファイルの記録を無視して再アップロードする"
+    )
 
     args = parser.parse_args()
 
+    # 1回目のSIGINT/SIGTERMで新しいアップロードとクォータ待ちを止め、実行中のものを終えてから終了する。
+    # 2回目は既定の動作に戻すので、Ctrl-Cをもう一度押せば実行中のアップロードも打ち切れる
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info("\n中断要求を受け取りました。実行中のアップロードの完了を待っています..."
+                    "（もう一度Ctrl-Cで強制終了）")
+        stop_event.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
     try:
-        _, summary = batch_upload(args.metadata)
+        # ブラウザ認証中はハンドラを入れず、Ctrl-Cでそのまま中断できるようにする
+        credentials = get_credentials()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        _, summary = batch_upload(args.metadata, max_workers=args.max_workers,
+                                  stop_event=stop_event, credentials=credentials,
+                                  ignore_uploaded=args.ignore_uploaded)
+
+        if stop_event.is_set():
+            logger.info("中断されました")
+            sys.exit(130)
 
         if summary['failed'] > 0:
             sys.exit(1)